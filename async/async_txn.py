@@ -1,18 +1,25 @@
-from fastapi import FastAPI
-from common import DatastoreClientProxy
-from concurrent.futures import ThreadPoolExecutor
-from translation_utils import openai_translate, strip_header_and_footer
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from common import AsyncJobStatus, DatastoreClientProxy
+import glossary
+from job_queue import extend_lease, JobQueue
+from translation_utils import openai_translate_async, strip_header_and_footer
 from datetime import datetime
 from zoneinfo import ZoneInfo
 # if running on python 3.8 the above line needs to be changed to
 # from backports.zoneinfo import ZoneInfo
 from google.oauth2 import service_account
+import httpx
 import os
-
-app = FastAPI()
+import time
 
 project_id = os.getenv("PROJECT_ID")
 service_account_json = os.getenv("SERVICE_ACCOUNT_JSON_LOC")
+# where to tell the web app that a job is finished, e.g. https://YOUR-APP.appspot.com/async_job_done
+# if not set, the pending page will still find out - just not as quickly
+web_callback_url = os.getenv("WEB_CALLBACK_URL")
+web_callback_secret = os.getenv("ASYNC_CALLBACK_SECRET", "")
 
 if not project_id or not service_account_json or not os.path.isfile(service_account_json):
     print("Environment variables PROJECT_ID and SERVICE_ACCOUNT_JSON_LOC must be defined.")
@@ -21,29 +28,109 @@ if not project_id or not service_account_json or not os.path.isfile(service_acco
 credentials = service_account.Credentials.from_service_account_file(service_account_json)
 
 datastore_client = DatastoreClientProxy.get_instance(project=project_id, credentials=credentials)
+# so the glossary is checked for in our project, not the default one
+glossary.use_datastore_client(datastore_client)
 # more relevant reading about authentication with Service Accounts:
 # https://googleapis.dev/python/google-api-core/latest/auth.html
 # https://googleapis.dev/python/google-auth/latest/user-guide.html#service-account-private-key-files
 # https://cloud.google.com/iam/docs/service-accounts-create
 
-executor = ThreadPoolExecutor(3)
+# while OpenAI streams its output we save what we have so far to the job, so that translators can start reading.
+# Datastore doesn't like frequent writes to the same entity, so only write every few seconds.
+PARTIAL_RESULT_WRITE_INTERVAL_SECS = 3
+# a rough guess at how much longer (in characters) the translation is than the Hebrew, used to estimate progress
+TRANSLATION_LENGTH_RATIO = {"en": 1.3, "fr": 1.5}
 
-@app.get("/")
-def read_root():
-    return {"Hello": "World"}
+def estimate_progress(heb_text, partial_translation, target_lang):
+    expected_length = len(heb_text) * TRANSLATION_LENGTH_RATIO.get(target_lang, 1.3)
+    if expected_length == 0:
+        return 0
+    # never claim to be done until OpenAI tells us we are
+    return min(99, int(100 * len(partial_translation) / expected_length))
+
+
+async def call_openai(heb_text, target_lang, model, custom_dirs, async_job):
+    # partial results are large and must not be indexed; older jobs may not have been created with this setting
+    async_job.exclude_from_indexes.update(("translation_result", "translation_partial"))
+    last_write = time.monotonic()
+
+    async def save_partial_result(partial_translation):
+        nonlocal last_write
+        if time.monotonic() - last_write < PARTIAL_RESULT_WRITE_INTERVAL_SECS:
+            return
+        last_write = time.monotonic()
+        async_job.update({"translation_partial": partial_translation,
+                          "translation_progress": estimate_progress(heb_text, partial_translation, target_lang)})
+        extend_lease(async_job)   # we're clearly still alive and working on it
+        await asyncio.to_thread(datastore_client.put, async_job)
 
-def call_openai(heb_text, target_lang, model, custom_dirs, async_job):
-    print("Calling OpenAI...")
-    tx_result = openai_translate(heb_text, target_lang, model=model, custom_dirs=custom_dirs)
-    print("OpenAI returned, writing to DB")
+    print(f"Calling OpenAI for job {async_job.key.id}...")
+    transaction_context = {}
+    tx_result = await openai_translate_async(heb_text, target_lang, model=model, custom_dirs=custom_dirs,
+                                             transaction_context=transaction_context, on_partial=save_partial_result)
+    print(f"OpenAI returned for job {async_job.key.id}, writing to DB")
 
     async_job.update({"translation_timestamp": datetime.now(tz=ZoneInfo('Asia/Jerusalem')),
-                   "translation_result": tx_result, "result_code": "Success"})
-    datastore_client.put(async_job)
+                      "translation_result": tx_result, "translation_partial": "", "translation_progress": 100,
+                      "result_code": "Success", "job_status": AsyncJobStatus.DONE.name})
+    # kept on the job so we can measure what OpenAI's prompt caching saves in cost and latency
+    usage = transaction_context.get("openai_usage", {})
+    async_job.update({"openai_input_tokens": usage.get("input_tokens"),
+                      "openai_cached_tokens": usage.get("cached_tokens"),
+                      "openai_output_tokens": usage.get("output_tokens")})
+    await asyncio.to_thread(datastore_client.put, async_job)
+
+
+async def process_job(my_job):
+    translation_target_lang = my_job["translation_lang"]
+    heb_text = my_job["heb_text"]
+    heb_text = strip_header_and_footer(heb_text, translation_target_lang, draft_id=my_job["heb_draft_id"])
+    openai_model = my_job["translation_engine"]
+    if openai_model and openai_model.startswith("openai/"):
+        openai_model = openai_model.split("/",1)[1]
+    else:
+        openai_model = "gpt-4o"
+    custom_dirs = my_job["translation_custom_dirs"] or ""
+    await call_openai(heb_text, translation_target_lang, openai_model, custom_dirs, my_job)
+
+
+async def notify_web_app(my_job):
+    if not web_callback_url:
+        return
+    try:
+        async with httpx.AsyncClient(timeout=10) as http_client:
+            response = await http_client.post(web_callback_url,
+                                              data={"async_request_id": str(my_job.key.id),
+                                                    "result_code": my_job.get("result_code", "")},
+                                              headers={"X-Async-Callback-Secret": web_callback_secret})
+        if response.status_code != 200:
+            print(f"notify_web_app: job {my_job.key.id} callback returned {response.status_code}")
+    except httpx.HTTPError as err:
+        # not fatal, the web app falls back to checking the DB
+        print(f"notify_web_app: job {my_job.key.id} callback failed: {err}")
+
+
+job_queue = JobQueue(datastore_client, process_job, on_finished=notify_web_app)
+
+
+@asynccontextmanager
+async def lifespan(fastapi_app):
+    # the sweeper which starts here also picks up any jobs which were in flight when we last went down
+    job_queue.start()
+    yield
+    job_queue.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/")
+def read_root():
+    return {"Hello": "World", "queue_depth": job_queue.depth()}
 
 
 @app.get("/items/{item_id}")
-def read_item(item_id: int):
+async def read_item(item_id: int):
     # query = datastore_client.query(kind="async_job")
     # query.add_filter(filter=PropertyFilter("heb_author_id", "=", item_id))
     # jobs = query.fetch()
@@ -54,19 +141,16 @@ def read_item(item_id: int):
     #         my_job = job
     #         break
 
-    my_job = datastore_client.get(datastore_client.key("async_job", item_id))
+    my_job = await asyncio.to_thread(datastore_client.get, datastore_client.key("async_job", item_id))
 
     if my_job:
-        translation_target_lang = my_job["translation_lang"]
-        heb_text = my_job["heb_text"]
-        heb_text = strip_header_and_footer(heb_text, translation_target_lang)
-        openai_model = my_job["translation_engine"]
-        if openai_model and openai_model.startswith("openai/"):
-            openai_model = openai_model.split("/",1)[1]
-        else:
-            openai_model = "gpt-4o"
-        custom_dirs = my_job["translation_custom_dirs"] or ""
-        executor.submit(call_openai, heb_text, translation_target_lang, openai_model, custom_dirs, my_job)
+        if "job_status" not in my_job:
+            # created by a version of the web app which predates the job queue
+            my_job.update({"job_status": AsyncJobStatus.QUEUED.name, "attempts": 0})
+            await asyncio.to_thread(datastore_client.put, my_job)
+        if not job_queue.submit(item_id):
+            # backpressure - the job is safely QUEUED in the DB and the sweeper will get to it when there's room
+            raise HTTPException(status_code=503, detail=f"Queue is full, job {item_id} will be processed later")
 
         return {"item_id": item_id, "heb_draft_id": my_job["heb_draft_id"]}
     else:
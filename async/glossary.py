@@ -0,0 +1 @@
+../project/glossary.py
\ No newline at end of file
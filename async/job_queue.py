@@ -0,0 +1,201 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+############################################
+# A durable queue of async_job entities
+#
+# The async_job entity in the DB is the source of truth - the in-memory queue only holds the IDs of jobs
+# which we believe are ready to run. Its job_status property moves through these states:
+#
+#   QUEUED --(a worker claims it)--> LEASED --(translation succeeded)--> DONE
+#                                      |
+#                                      +--(failed)--> QUEUED again, not before next_attempt_at (exponential backoff)
+#                                      +--(failed MAX_ATTEMPTS times)--> DEAD, with result_code "Failed"
+#                                      +--(worker died, lease_expires passed)--> picked up again by the sweeper
+#
+# Claiming is done in a transaction so that a job can't be processed by two workers at once.
+# The sweeper runs on startup and then periodically, re-enqueuing anything that is QUEUED and due, or whose
+# lease has expired, so nothing is lost if the process crashes or the in-memory queue was full.
+#
+# The queue runs on the FastAPI event loop: each job is an asyncio task, and an asyncio.Semaphore limits how many
+# run at once. The DB client is synchronous, so DB calls are pushed off the event loop with asyncio.to_thread.
+
+import asyncio
+from datetime import datetime, timedelta
+import os
+import traceback
+
+from google.cloud.datastore.query import PropertyFilter
+
+from common import AsyncJobStatus, JERUSALEM_TZ
+
+WORKER_COUNT = int(os.getenv("ASYNC_WORKERS", "20"))    # max jobs being processed concurrently
+MAX_QUEUED_JOBS = int(os.getenv("ASYNC_MAX_QUEUED_JOBS", "50"))
+MAX_ATTEMPTS = int(os.getenv("ASYNC_MAX_ATTEMPTS", "3"))
+LEASE_SECS = int(os.getenv("ASYNC_LEASE_SECS", "300"))
+RETRY_BASE_SECS = int(os.getenv("ASYNC_RETRY_BASE_SECS", "10"))
+SWEEP_INTERVAL_SECS = int(os.getenv("ASYNC_SWEEP_INTERVAL_SECS", "30"))
+
+
+def claim_job(datastore_client, job_id, worker_name):
+    """Atomically move a job from QUEUED (or LEASED with an expired lease) to LEASED.
+    Returns the job entity if this worker now owns it, otherwise None."""
+    now = datetime.now(tz=JERUSALEM_TZ)
+    with datastore_client.transaction():
+        job = datastore_client.get(datastore_client.key("async_job", job_id))
+        if job is None:
+            return None
+        status = job.get("job_status")
+        if status == AsyncJobStatus.QUEUED.name:
+            if job.get("next_attempt_at") and job["next_attempt_at"] > now:
+                return None
+        elif status == AsyncJobStatus.LEASED.name:
+            if job.get("lease_expires") and job["lease_expires"] > now:
+                return None   # someone else is working on it
+            print(f"claim_job: lease on job {job_id} held by {job.get('leased_by')} has expired, taking it over")
+        else:
+            return None
+        job.update({"job_status": AsyncJobStatus.LEASED.name, "leased_by": worker_name,
+                    "lease_expires": now + timedelta(seconds=LEASE_SECS),
+                    "attempts": job.get("attempts", 0) + 1})
+        datastore_client.put(job)
+    return job
+
+
+def extend_lease(job):
+    # call before each put of a job which is being worked on, so that long-running jobs aren't taken over
+    job.update({"lease_expires": datetime.now(tz=JERUSALEM_TZ) + timedelta(seconds=LEASE_SECS)})
+
+
+def fail_job(datastore_client, job, err):
+    attempts = job.get("attempts", 1)
+    job.update({"last_error": str(err)[:1500]})
+    if attempts >= MAX_ATTEMPTS:
+        print(f"fail_job: job {job.key.id} failed {attempts} times, giving up on it")
+        job.update({"job_status": AsyncJobStatus.DEAD.name, "result_code": "Failed"})
+    else:
+        retry_in = RETRY_BASE_SECS * (2 ** (attempts - 1))
+        print(f"fail_job: job {job.key.id} failed (attempt {attempts}), will retry in {retry_in} seconds")
+        job.update({"job_status": AsyncJobStatus.QUEUED.name,
+                    "next_attempt_at": datetime.now(tz=JERUSALEM_TZ) + timedelta(seconds=retry_in)})
+    datastore_client.put(job)
+
+
+def find_runnable_job_ids(datastore_client):
+    now = datetime.now(tz=JERUSALEM_TZ)
+    runnable = []
+
+    query = datastore_client.query(kind="async_job")
+    query.add_filter(filter=PropertyFilter("job_status", "=", AsyncJobStatus.QUEUED.name))
+    for job in query.fetch():
+        if not job.get("next_attempt_at") or job["next_attempt_at"] <= now:
+            runnable.append(job.key.id)
+
+    query = datastore_client.query(kind="async_job")
+    query.add_filter(filter=PropertyFilter("job_status", "=", AsyncJobStatus.LEASED.name))
+    for job in query.fetch():
+        if not job.get("lease_expires") or job["lease_expires"] <= now:
+            runnable.append(job.key.id)
+
+    return runnable
+
+
+class JobQueue:
+
+    def __init__(self, datastore_client, process_job, on_finished=None) -> None:
+        # process_job(job) is a coroutine function which does the actual work and marks the job DONE;
+        # if it raises, the job is retried.
+        # on_finished(job), if given, is a coroutine function awaited once the job is DONE or DEAD
+        self.datastore_client = datastore_client
+        self.process_job = process_job
+        self.on_finished = on_finished
+        self.pending = None           # the asyncio objects are created in start(), on the event loop
+        self.worker_slots = None
+        self.pending_ids = set()      # to avoid queueing the same job twice
+        self.tasks = set()            # we must hold references to running tasks or they may be garbage collected
+        self.worker_number = 0
+
+    def submit(self, job_id):
+        """Must be called from the event loop. Returns False if the queue is full.
+        The job is still safe in the DB, the sweeper will get to it."""
+        if job_id in self.pending_ids:
+            return True
+        try:
+            self.pending.put_nowait(job_id)
+        except asyncio.QueueFull:
+            print(f"JobQueue: queue is full, job {job_id} will wait for the sweeper")
+            return False
+        self.pending_ids.add(job_id)
+        return True
+
+    def depth(self):
+        return self.pending.qsize() if self.pending else 0
+
+    def start(self):
+        self.pending = asyncio.Queue(maxsize=MAX_QUEUED_JOBS)
+        self.worker_slots = asyncio.Semaphore(WORKER_COUNT)
+        self._spawn(self._dispatch())
+        self._spawn(self._sweep())
+
+    def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _dispatch(self):
+        while True:
+            job_id = await self.pending.get()
+            self.pending_ids.discard(job_id)
+            await self.worker_slots.acquire()
+            self.worker_number += 1
+            self._spawn(self._run(job_id, f"{os.getpid()}-job-{self.worker_number}"))
+
+    async def _run(self, job_id, worker_name):
+        try:
+            job = await asyncio.to_thread(claim_job, self.datastore_client, job_id, worker_name)
+            if job is None:
+                return
+            try:
+                await self.process_job(job)
+            except Exception as err:  # noqa - whatever went wrong, the job must not be left hanging
+                traceback.print_exc()
+                await asyncio.to_thread(fail_job, self.datastore_client, job, err)
+            if self.on_finished and job.get("job_status") in (AsyncJobStatus.DONE.name, AsyncJobStatus.DEAD.name):
+                await self.on_finished(job)
+        finally:
+            self.worker_slots.release()
+
+    async def _sweep(self):
+        while True:
+            try:
+                for job_id in await asyncio.to_thread(find_runnable_job_ids, self.datastore_client):
+                    if not self.submit(job_id):
+                        break
+            except Exception:  # noqa - keep sweeping even if the DB had a hiccup
+                traceback.print_exc()
+            await asyncio.sleep(SWEEP_INTERVAL_SECS)
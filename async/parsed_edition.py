@@ -0,0 +1 @@
+../project/parsed_edition.py
\ No newline at end of file
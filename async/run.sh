@@ -4,4 +4,6 @@
 export PROJECT_ID=tamtzit-hadashot
 export OPENAI_API_KEY="YOUR-KEY-HERE"
 export SERVICE_ACCOUNT_JSON_LOC="/path/to/tamtzit-datastore-access-service-acct-key.json"
+export WEB_CALLBACK_URL="https://YOUR-APP.appspot.com/async_job_done"
+export ASYNC_CALLBACK_SECRET="YOUR-SECRET-HERE"
 venv/bin/fastapi run async_txn.py --port 5081 &
@@ -0,0 +1 @@
+../project/text_swaps.py
\ No newline at end of file
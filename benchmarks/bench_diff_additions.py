@@ -0,0 +1,143 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+
+# Compares diff_draft_versions.get_substantial_additions with the version it replaced (copied below
+# unchanged), both for identical output and for speed.
+#
+# usage, from the repository root:
+#   PYTHONPATH=project python benchmarks/bench_diff_additions.py [number-of-random-editions]
+#
+# The editions are random but look like ours: sections of bullets made of Hebrew words, and a "later" version
+# of each with some bullets unchanged, some lightly edited, some rewritten, some new and some removed -
+# which is what the translators' delta view is comparing all day.
+
+from collections import defaultdict
+from difflib import SequenceMatcher
+import random
+import sys
+import timeit
+
+from diff_draft_versions import get_substantial_additions
+from parsed_edition import parse_for_comparison
+
+WORDS = ("צה\"ל הודיע כי לוחמי חטיבת גולני פעלו הלילה ברצועת עזה ובדרום לבנון ראש הממשלה נתניהו אמר "
+         "שר הביטחון כ\"ץ נפגשו במהלך היום עם משפחות החטופים בירושלים ובתל אביב הותר לפרסום כי "
+         "רקטות שוגרו לעבר יישובי עוטף עזה ונשמעו אזעקות בצפון אין נפגעים דיווח על פיצוץ").split()
+SECTIONS = ["מלחמת חרבות ברזל", "החזית הדרומית", "החזית הצפונית", "בעולם", "בארץ", "פוליטי"]
+
+
+def legacy_get_substantial_additions(parsed_heb_draft, parsed_backup):
+    additions = defaultdict(list)
+
+    for section in parsed_heb_draft:
+        if section not in parsed_backup:
+            # debug(f"The section {section} is entirely missing from the backup")
+            additions[section] = parsed_heb_draft[section]
+            continue
+        backup_section = parsed_backup[section]
+        for bullet in parsed_heb_draft[section]:
+            if len(bullet) < 5:
+                continue
+            best_fit = max([SequenceMatcher(None, backup_bullet, bullet).ratio() for backup_bullet in backup_section])
+            if best_fit < 0.66:
+                # print(f"More than one third ({best_fit}) has been changed, let's consider it added to {section}:")
+                # print(bullet)
+                additions[section].append(bullet)
+    return additions
+
+
+def random_bullet(rng):
+    return "• " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 60)))
+
+
+def edit_bullet(rng, bullet):
+    words = bullet.split(" ")
+    for _ in range(rng.randint(1, max(1, len(words) // 2))):
+        position = rng.randrange(1, len(words))
+        if rng.random() < 0.5:
+            words[position] = rng.choice(WORDS)
+        else:
+            words.insert(position, rng.choice(WORDS))
+    return " ".join(words)
+
+
+def random_edition_pair(rng, bullets_per_section=12):
+    before = []
+    after = []
+    for section in SECTIONS:
+        before.append(f"📌 *{section}:*")
+        after.append(f"📌 *{section}:*")
+        for _ in range(rng.randint(1, bullets_per_section)):
+            bullet = random_bullet(rng)
+            before.append(bullet)
+            choice = rng.random()
+            if choice < 0.5:
+                after.append(bullet)
+            elif choice < 0.75:
+                after.append(edit_bullet(rng, bullet))
+            elif choice < 0.85:
+                after.append(random_bullet(rng))
+            # else it was removed
+            if rng.random() < 0.2:
+                after.append(random_bullet(rng))
+            before.append("")
+            after.append("")
+    return "\n".join(after), "\n".join(before)
+
+
+def check_identical(pairs):
+    differences = 0
+    for current, backup in pairs:
+        parsed_current = parse_for_comparison(current.split("\n"))
+        parsed_backup = parse_for_comparison(backup.split("\n"))
+        if (legacy_get_substantial_additions(parsed_current, parsed_backup) !=
+                get_substantial_additions(parsed_current, parsed_backup)):
+            differences += 1
+    return differences
+
+
+def benchmark(name, function, parsed_current, parsed_backup, number=5):
+    seconds = min(timeit.repeat(lambda: function(parsed_current, parsed_backup), number=number, repeat=5)) / number
+    print(f"{name:40} {seconds * 1000:10.2f} ms per call")
+    return seconds
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rng = random.Random(1)
+    differences = check_identical([random_edition_pair(rng) for _ in range(count)])
+    print(f"compared {count} edition pairs: {differences} differences\n")
+
+    for bullets_per_section in [12, 40]:
+        current, backup = random_edition_pair(random.Random(2), bullets_per_section)
+        parsed_current = parse_for_comparison(current.split("\n"))
+        parsed_backup = parse_for_comparison(backup.split("\n"))
+        print(f"up to {bullets_per_section} bullets per section:")
+        old = benchmark("legacy_get_substantial_additions", legacy_get_substantial_additions,
+                        parsed_current, parsed_backup)
+        new = benchmark("get_substantial_additions", get_substantial_additions, parsed_current, parsed_backup)
+        print(f"{'':40} {old / new:10.1f}x faster")
+
+    sys.exit(1 if differences else 0)
@@ -0,0 +1,81 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+
+# What a debug message costs when debug logging is off, the usual case in production: the old way, where the
+# caller builds an f-string (here, of a whole edition, as several call sites did), against a module logger
+# given the values as arguments, and against not logging at all. The logger call isn't free even when suppressed:
+# it still costs about 0.3µs, for the method call and level check - 2-3 times less than debug(f-string), not nothing.
+#
+# usage, from the repository root:
+#   PYTHONPATH=project python benchmarks/bench_logging.py
+
+import logging
+import timeit
+
+from common import _set_debug, debug, get_logger, lazy
+
+edition = ("📌 *מלחמת חרבות ברזל:*\n" + "• צה\"ל הודיע כי לוחמי חטיבת גולני פעלו הלילה ברצועת עזה\n\n" * 60)
+lines = edition.split("\n")
+log = get_logger("bench_logging")
+
+
+def no_logging():
+    for line in lines:
+        pass
+
+
+def old_debug():
+    debug(f"RAW HEBREW:--------\n{edition}")
+    for line in lines:
+        debug(f"{len(line)}: {line}")
+
+
+def logger_with_args():
+    log.debug("RAW HEBREW:--------\n%s", edition)
+    for line in lines:
+        log.debug("%s: %s", len(line), line)
+
+
+def logger_with_lazy():
+    log.debug("RAW HEBREW:--------\n%s", lazy(lambda: edition.replace("\n", " ")))
+    for line in lines:
+        log.debug("%s: %s", len(line), line)
+
+
+def benchmark(name, function, number=2000):
+    seconds = min(timeit.repeat(function, number=number, repeat=5)) / number
+    print(f"{name:40} {seconds * 1000000:10.2f} µs per edition")
+    return seconds
+
+
+if __name__ == "__main__":
+    _set_debug(False)
+    assert not log.isEnabledFor(logging.DEBUG)
+    print(f"{len(lines)} lines, debug off:")
+    baseline = benchmark("no logging", no_logging)
+    for name, function in [("debug(f-string)", old_debug), ("log.debug(format, args)", logger_with_args),
+                           ("log.debug(format, lazy(...))", logger_with_lazy)]:
+        seconds = benchmark(name, function)
+        print(f"{'':40} {(seconds - baseline) * 1000000 / len(lines):10.3f} µs per message over no logging")
@@ -0,0 +1,179 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+
+# Compares parsing a draft's text once into a (cached) ParsedEdition with what was done before: each of
+# parse_for_comparison, strip_header_and_footer, get_edition_name_from_text and do_edits_reach_last_two_sections
+# scanning the raw text itself, on every call. The old versions are copied below unchanged (less their debug
+# calls), and the results are checked to be identical.
+#
+# usage, from the repository root:
+#   PYTHONPATH=project python benchmarks/bench_parsed_edition.py
+#
+# "A request" here is the parsing done for a translator's delta view plus a Hebrew save: comparing the current
+# Hebrew with the translation's base, stripping it for translation, its edition name and its last two sections.
+
+from collections import defaultdict
+import itertools
+import random
+import re
+import sys
+import timeit
+
+from language_mappings import sections, translated_section_names
+from parsed_edition import get_parsed_edition
+
+section_header_pat = re.compile(r"[📌>] \*?_?([^_:*]+):_?\*?")
+
+HEADER = """*מהדורת ערב, יום שלישי, י"ז בתשרי תשפ"ו*
+*14 באוקטובר 2025*
+*היום ה-739 למלחמה*
+
+"""
+FOOTER = """
+•   •   •
+להצטרפות לקבוצה: https://chat.whatsapp.com/example
+כתבו: פלונית אלמונית
+"""
+WORDS = ("צה\"ל הודיע כי לוחמי חטיבת גולני פעלו הלילה ברצועת עזה ובדרום לבנון ראש הממשלה נתניהו אמר "
+         "שר הביטחון כ\"ץ נפגשו במהלך היום עם משפחות החטופים בירושלים ובתל אביב הותר לפרסום כי").split()
+
+
+def make_edition(rng):
+    text = HEADER
+    for section in list(sections['keys_from_Hebrew'])[:10]:
+        text += f"📌 *{section}:*\n"
+        for _ in range(rng.randint(3, 10)):
+            text += "• " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 50))) + "\n\n"
+    return text + FOOTER
+
+
+def legacy_parse_for_comparison(text):
+    result = defaultdict(list)
+    section = None
+    current_entry = None
+    for line in text:
+        line = line.strip()
+        if len(line.replace("•", "").strip()) == 0:
+            current_entry = None
+            continue
+        if not re.match("^[•📌>-]", line):
+            if current_entry:
+                result[section][-1] = result[section][-1] + "\n" + line
+        elif not (line.startswith("•") or line.startswith("-")):
+            section = line
+            for heb_section in sections['keys_from_Hebrew']:
+                if heb_section in line:
+                    section = heb_section
+                    break
+        else:
+            current_entry = line
+            result[section].append(current_entry)
+    return result
+
+
+def legacy_strip_header_and_footer(heb_text, target_language_code):
+    stripped_heb_text = ""
+    found_a_pin = False
+    in_footer = False
+
+    for line in heb_text.split("\n"):
+        if not found_a_pin:
+            if "📌" in line:
+                found_a_pin = True
+            else:
+                continue
+        else:
+            if not in_footer and ("• • •" in line or "•   •   •" in line):
+                in_footer = True
+
+            if in_footer:
+                continue
+
+        header_match = section_header_pat.match(line)
+        if header_match:
+            if header_match.group(1) in translated_section_names[target_language_code]:
+                line = line.replace(header_match.group(1), translated_section_names[target_language_code][header_match.group(1)])
+
+        stripped_heb_text = stripped_heb_text + line + "\n"
+    return stripped_heb_text
+
+
+def legacy_edition_name(text):
+    m = re.search("^\*?מהדורת ([א-ת]+),", text, re.MULTILINE)   # noqa - the pattern works
+    if m:
+        return "regular", m.group(1)
+    if re.search("^\*?מהדורה יומית", text, re.MULTILINE):   # noqa
+        return "daily_summary", None
+    if re.search("^\*?מהדורת מוצאי שבת, ", text, re.MULTILINE):   # noqa
+        return "motzei_shabbat", None
+    return None
+
+
+def legacy_last_two_sections(text):
+    last_heading = text.rfind("📌")
+    second_last_heading = text.rfind("📌", 0, last_heading)
+    footer_start_pos = text.find("•   •   •", last_heading)
+    return text[second_last_heading:footer_start_pos]
+
+
+def legacy_request(current, base):
+    return (legacy_parse_for_comparison(current.split("\n")), legacy_parse_for_comparison(base.split("\n")),
+            legacy_strip_header_and_footer(current, "en"), legacy_edition_name(current),
+            legacy_last_two_sections(current), legacy_last_two_sections(base))
+
+
+def request(current, base):
+    parsed_current = get_parsed_edition(current, 1)
+    parsed_base = get_parsed_edition(base, 1)
+    return (parsed_current.sections, parsed_base.sections, parsed_current.stripped("en"),
+            parsed_current.edition_name, parsed_current.last_two_sections, parsed_base.last_two_sections)
+
+
+def benchmark(name, function, current, base, number=200):
+    seconds = min(timeit.repeat(lambda: function(current, base), number=number, repeat=5)) / number
+    print(f"{name:40} {seconds * 1000000:10.1f} µs per request")
+    return seconds
+
+
+if __name__ == "__main__":
+    rng = random.Random(1)
+    differences = 0
+    for _ in range(100):
+        current, base = make_edition(rng), make_edition(rng)
+        if legacy_request(current, base) != request(current, base):
+            differences += 1
+    print(f"compared 100 edition pairs: {differences} differences\n")
+
+    current, base = make_edition(rng), make_edition(rng)
+    old = benchmark("parsing each time", legacy_request, current, base)
+    new = benchmark("ParsedEdition, cached", request, current, base)
+    print(f"{'':40} {old / new:10.1f}x faster")
+    # the first request for a new version of the text pays for the parse
+    versions = itertools.count()
+    new = benchmark("ParsedEdition, every text new",
+                    lambda c, b: request(c + str(next(versions)), b + str(next(versions))), current, base)
+    print(f"{'':40} {old / new:10.1f}x faster")
+
+    sys.exit(1 if differences else 0)
@@ -0,0 +1,228 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+# Compares text_swaps' single-scan pre/post translation swaps with the implementation they replaced (one re.sub per
+# rule, copied below unchanged), both for identical output and for speed. The rules now come from glossary.json,
+# so once they are changed there, differences are expected wherever the change has an effect.
+#
+# usage, from the repository root:
+#   PYTHONPATH=project python benchmarks/bench_translation_swaps.py [number-of-random-texts]
+#
+# Besides a realistic edition, it generates random texts built out of the words the rules look for, with random
+# prefixes, case and punctuation, which is far better at finding differences than real text is.
+
+import random
+import re
+import sys
+import timeit
+
+from glossary import load_glossary_file
+from text_swaps import GlossarySwaps, tx_heb_prefix, vav_hey
+
+# straight from the file, so as not to depend on the DB
+glossary = load_glossary_file()
+title_translations = glossary["titles"]
+glossary_swaps = GlossarySwaps(glossary)
+pre_translation_swaps = glossary_swaps.pre_translation_swaps
+post_translation_swaps = glossary_swaps.post_translation_swaps
+
+
+def legacy_pre_translation_swaps(text, target_language_code):
+    if target_language_code in title_translations:
+        for title in title_translations[target_language_code]:
+            text = re.sub(fr'\b(ו?)(ה?){title}\b', vav_hey(title_translations[target_language_code][title]), text, flags=re.U)
+
+    # our Motzei Shabbat header is confused for regular content, this is an easy way to get rid of it
+    text = re.sub(r'\*עדכון מוצאי שבת\*', '', text, flags=re.U)
+    text = re.sub(r'קוראים יקרים, זהו עדכון מקוצר. מהדורה רגילה תישלח אחרי 21:00.', '', text, flags=re.U)
+    # and this is from the Friday afternoon edition
+    text = re.sub(r'\*קוראים יקרים,\*', '', text, flags=re.U)
+    text = re.sub(r'\*המהדורה הבאה תישלח במוצאי שבת, בשעה הרגילה של מהדורת הערב.\*', '', text, flags=re.U)
+
+    text = re.sub(r'\bמשגב עם\b', 'Misgav Am', text, flags=re.U)
+
+    if target_language_code == 'en':
+        text = re.sub(r'\bהי"ד\b',   'HYD', text, flags=re.U)
+        
+        text = re.sub(r'\b(ב)צו?הריים\b', lambda m: ("in " if m.group(1).startswith("ב") else '') + 'the afternoon', 
+                    text, flags=re.U)
+        text = re.sub(r'\b(אחר )?ה?צו?הריים\b', 'the afternoon', text, flags=re.U)
+
+        # text = re.sub(r'\bהלילה\b', 'last night', text, flags=re.U)  # removing, it's wrong half the time
+        text = re.sub(r'\bיישוב\b', "community", text, flags=re.U)
+        text = re.sub(r'\bיישובים\b', "communities", text, flags=re.U)
+
+        text = re.sub(r'\b([למהבו]+)?עוטף עזה\b', lambda m: tx_heb_prefix(m.group(1), "en") + 'the Gaza envelope', text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?עוטף\b', lambda m: tx_heb_prefix(m.group(1), "en") + 'the Gaza envelope [?]', text, flags=re.U)
+
+        text = re.sub(r'\bהסברה\b', 'hasbara (public diplomacy)', text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?חלל(י)?\b', lambda m: tx_heb_prefix(m.group(1), "en") + 'fallen', text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?כטמ"[מם]\b', lambda m: tx_heb_prefix(m.group(1), "en") + "UAV", text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?אמל"ח\b', lambda m: tx_heb_prefix(m.group(1), "en") + "weapons", text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?חטוף\b', lambda m: tx_heb_prefix(m.group(1), "en") + "hostage", text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?חטופים\b', lambda m: tx_heb_prefix(m.group(1), "en") + "hostages", text, flags=re.U)
+        text = re.sub(r'\bחטיבת ה?אש\b', "artillery brigade", text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?יחידת ה?לוט"ר\b', lambda m: tx_heb_prefix(m.group(1), "en") + "LOTAR (counter-terrorism special forces) unit", text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?אגורות\b', lambda m: tx_heb_prefix(m.group(1), "en") + "agorot", text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?אגורה\b', lambda m: tx_heb_prefix(m.group(1), "en") + "agora", text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?מרגש\b', lambda m: tx_heb_prefix(m.group(1), "en") + "moving", text, flags=re.U)
+
+    elif target_language_code == 'fr':
+        text = re.sub(r'\bבית משפט מחוזי\b', "Cour d'Appel", text, flags=re.U)
+        text = re.sub(r'\bהותר לפרסום\b', "Il a été autorisé à la publication", text, flags=re.U)
+        text = re.sub(r'\bיהי זכרו ברוך\b', "Que sa mémoire soit bénie", text, flags=re.U)
+        text = re.sub(r'\bיהי זכרם ברוך\b', "Que leur mémoire soit bénie", text, flags=re.U)
+        text = re.sub(r'\bיישוב\b', "localité", text, flags=re.U)
+        text = re.sub(r'\bיישובים\b', "localités", text, flags=re.U)
+        text = re.sub(r'\bכותל המערבי\b', "Kotel", text, flags=re.U)
+        text = re.sub(r'\bהלילה\b', 'la nuit dernière', text, flags=re.U)
+
+        text = re.sub(r'\b([למהבו]+)?עוטף עזה\b', lambda m: tx_heb_prefix(m.group(1), "fr") + 'La zone autour de Gaza', text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)?עוטף\b', lambda m: tx_heb_prefix(m.group(1), "fr") + 'La zone autour de Gaza [?]', text, flags=re.U)
+
+        text = re.sub(r'\bהסברה\b', 'diplomatie publique', text, flags=re.U)
+        text = re.sub(r'\b([למהבו]+)כטב"[מם]\b', lambda m: tx_heb_prefix(m.group(1), "fr") + "drone", text, flags=re.U) 
+        text = re.sub(r'\b([למהבו]+)כטמ"[מם]\b', lambda m: tx_heb_prefix(m.group(1), "fr") + "drone de combat", text, flags=re.U) 
+
+    return text
+
+
+def legacy_post_translation_swaps(text, target_language_code):
+    if target_language_code == 'en':
+        text = re.sub('infrastructures', 'infrastructure', text, flags=re.IGNORECASE)
+        text = re.sub(r'\balarm(s?)\b', lambda m: "siren" + ('s' if m.group(1).startswith("s") else ''), text, flags=re.IGNORECASE)
+        text = re.sub(r'\b(a)n siren', "\\1 siren", text, flags=re.IGNORECASE)
+        text = re.sub('martyrs?', 'fallen', text, flags=re.IGNORECASE)
+        text = re.sub('allowed to be published', 'released for publication', text, flags=re.IGNORECASE)
+        text = re.sub("Judea and Samaria", "Yehuda and Shomron", text, flags=re.IGNORECASE)
+        text = re.sub("West Bank", "Yehuda and Shomron", text, flags=re.IGNORECASE)
+        text = re.sub("Beer Sheva", "Be'er Sheva", text, flags=re.IGNORECASE)
+        text = re.sub("slightly injured", "lightly injured", text, flags=re.IGNORECASE)
+        text = re.sub(r"ultra[ -]?orthodox", "Haredi", text, flags=re.IGNORECASE)
+        text = re.sub(r"red alert (siren)?", "siren", text, flags=re.IGNORECASE)
+        text = re.sub(r"Ben Gabir", "Ben Gvir", text)
+        text = re.sub("spokesman", "spokesperson", text, flags=re.IGNORECASE)
+        text = re.sub("militant", "terrorist", text, flags=re.IGNORECASE)
+        text = re.sub("settlement", "community", text, flags=re.IGNORECASE)
+        text = re.sub("strip", "Strip", text)
+
+    elif target_language_code == 'fr':
+        text = re.sub(r'\balarm(s?)\b', lambda m: "alert" + ('s' if m.group(1).startswith("s") else ''), text, flags=re.IGNORECASE)
+
+    text = re.sub(r'\bGalant\b', 'Gallant', text)
+    
+    return text
+
+sample_edition = """📌 *צפון:*
+• הלילה נשמעה אזעקה בקריית שמונה ובמשגב עם. לא דווח על נפגעים.
+• סגן אלוף (במיל') ישראל ישראלי, מפקד גדוד, נפצע קשה. רס"ן והסמל הראשון נפצעו קל.
+• כטמ"ם שוגר מלבנון לעבר אצבע הגליל ויורט.
+
+📌 *דרום:*
+• בצהריים נשמעו אזעקות ביישובי עוטף עזה. החטופים ששוחררו הגיעו לבית החולים.
+• הותר לפרסום: סמ"ר יוסי כהן, לוחם ביחידת הלוט"ר, נפל בקרב. יהי זכרו ברוך.
+• תת אלוף משנה? לא קיים. תא"ל ואלוף משנה השתתפו בדיון, והרמטכ"ל הגיע אחר הצהריים.
+• מחיר הלחם יעלה ב-30 אגורות. מרגש לראות את היישוב מתאושש.
+
+📌 *יהודה ושומרון:*
+• כוחות צה"ל פעלו הלילה במחנה הפליטים ג'נין. מחבל חוסל. מג"ד ומ"פ היו בשטח.
+"""
+
+sample_english = """📌 *North:*
+• An alarm sounded in Kiryat Shmona. Red alert alarms were also heard in the West Bank and Beer Sheva.
+• The IDF spokesman said a militant was killed; two soldiers were slightly injured near the settlement.
+• Ultra-orthodox protesters blocked the road. Minister Ben Gabir and former minister Galant responded.
+• Infrastructures in the Gaza strip were damaged. The names of the martyrs were allowed to be published.
+• Judea and Samaria: an ALARMS test, AN ALARM drill, and red alert siren tests.
+"""
+
+
+def random_texts(count, seed=1):
+    rng = random.Random(seed)
+    heb_words = [title for lang in title_translations for title in title_translations[lang]] + \
+        ["עדכון מוצאי שבת", "*עדכון מוצאי שבת*", "*קוראים יקרים,*", "משגב עם", 'הי"ד', "צהריים", "צוהריים",
+         "אחר", "יישוב", "יישובים", "עוטף", "עזה", "הסברה", "חלל", "חללי", 'כטמ"ם', 'כטמ"מ', 'כטב"ם', 'אמל"ח',
+         "חטוף", "חטופים", "חטיבת", "אש", "יחידת", 'לוט"ר', "אגורות", "אגורה", "מרגש", "בית", "משפט", "מחוזי",
+         "הותר", "לפרסום", "יהי", "זכרו", "זכרם", "ברוך", "כותל", "המערבי", "הלילה", "משנה", "אלוף", "רב", "תת",
+         "סגן", "ראשון", "שלום", "מחבל"]
+    eng_words = ["infrastructures", "alarm", "alarms", "ALARMS", "Alarm", "alarmed", "an", "An", "a", "siren",
+                 "sirens", "martyr", "martyrs", "allowed to be published", "Judea and Samaria", "West Bank",
+                 "Beer Sheva", "slightly injured", "ultra-orthodox", "ultra orthodox", "red alert", "Red Alert",
+                 "Ben Gabir", "spokesman", "militant", "militants", "settlement", "strip", "Galant", "Galants",
+                 "the", "news"]
+    prefixes = ["", "", "", "ו", "ה", "וה", "ב", "ל", "מ", "למ"]
+    separators = [" ", " ", " ", "\n", ", ", ". ", "-", "*", " (", ") ", ""]
+    texts = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(1, 25)):
+            if rng.random() < 0.5:
+                words.append(rng.choice(prefixes) + rng.choice(heb_words))
+            else:
+                word = rng.choice(eng_words)
+                words.append(word.upper() if rng.random() < 0.1 else word)
+            words.append(rng.choice(separators))
+        texts.append("".join(words))
+    return texts
+
+
+def check_identical(texts):
+    differences = 0
+    for text in texts:
+        for lang in ["en", "fr", "YY"]:
+            for legacy, current in [(legacy_pre_translation_swaps, pre_translation_swaps),
+                                    (legacy_post_translation_swaps, post_translation_swaps)]:
+                expected = legacy(text, lang)
+                actual = current(text, lang)
+                if expected != actual:
+                    differences += 1
+                    if differences <= 10:
+                        print(f"DIFFERENT ({current.__name__}, {lang}):\n  input:    {text!r}\n"
+                              f"  expected: {expected!r}\n  actual:   {actual!r}")
+    return differences
+
+
+def benchmark(name, function, text, lang, number=200):
+    seconds = min(timeit.repeat(lambda: function(text, lang), number=number, repeat=5)) / number
+    print(f"{name:40} {seconds * 1000000:10.1f} µs per call")
+    return seconds
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    texts = [sample_edition, sample_english] + random_texts(count)
+    differences = check_identical(texts)
+    print(f"compared {len(texts)} texts in 3 languages: {differences} differences\n")
+
+    edition = sample_edition * 10    # about the size of a real edition
+    english = sample_english * 10
+    for lang in ["en", "fr"]:
+        old = benchmark(f"legacy_pre_translation_swaps({lang})", legacy_pre_translation_swaps, edition, lang)
+        new = benchmark(f"pre_translation_swaps({lang})", pre_translation_swaps, edition, lang)
+        print(f"{'':40} {old / new:10.1f}x faster")
+        old = benchmark(f"legacy_post_translation_swaps({lang})", legacy_post_translation_swaps, english, lang)
+        new = benchmark(f"post_translation_swaps({lang})", post_translation_swaps, english, lang)
+        print(f"{'':40} {old / new:10.1f}x faster")
+
+    sys.exit(1 if differences else 0)
@@ -35,7 +35,8 @@ def create_app():
     # print(f"this file is in {os.path.dirname(os.path.realpath(__file__))}")
     sys.path.append(os.path.dirname(os.path.realpath(__file__)))
     app = Flask(__name__)
-    app.wsgi_app = wrap_wsgi_app(app.wsgi_app)
+    # use_deferred lets us push slow work (e.g. precomputing translations) onto a task queue
+    app.wsgi_app = wrap_wsgi_app(app.wsgi_app, use_deferred=True)
     app.config['SECRET_KEY'] = 'uiHvrty90p3'
 
     from tamtzit import tamtzit as tamtzit_blueprint
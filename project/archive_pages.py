@@ -0,0 +1,523 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+
+############################################
+# The public archive of published editions, in Cloud Storage
+#
+# Each edition is an object of its own, archive/{lang}/{date}-{part of day}.html (the "anchor"), which is simply
+# overwritten when that edition is published again. For finding them there's a small index page per month,
+# archive/{lang}/months/{YYYY-MM}.html, and archive/{lang}/index.html, which lists the months.
+# Publishing an edition writes its own page and regenerates its month's index, and the list of months only when
+# a new month starts - nothing is downloaded, so the cost doesn't grow as the archive does.
+#
+# archive-{lang}.html is the archive as it used to be kept, every edition in one page. It's no longer
+# updated, the list of months links to it for everything before.
+#
+# Alongside each edition's page, archive/{lang}/json/{anchor}.json has the edition's text as JSON, and
+# archive/{lang}/search/{YYYY-MM}.json is a search index of that month's editions: each word, and the editions
+# it appears in. The list of months has a search box which fetches those, month by month, so a reader can
+# search the archive without downloading the editions. Publishing an edition only updates its own month's index.
+#
+# Publishing is done in the background, not in the save request of the editor who clicked "finished": see
+# request_archive_publish().
+
+from datetime import datetime
+import gzip
+import html
+import json
+import os
+import re
+import time
+from urllib.parse import quote
+
+from bs4 import BeautifulSoup
+from google.api_core.exceptions import PreconditionFailed
+from google.appengine.api import taskqueue
+from google.appengine.ext import deferred
+from google.cloud import datastore, storage
+
+from common import ARCHIVE_BASE, DatastoreClientProxy, get_logger, JERUSALEM_TZ
+from language_mappings import editions
+
+ARCHIVE_LANGS = ['he', 'en', 'fr']
+
+# how long a publish request waits for others for the same edition to come in, so they're all done in one go
+ARCHIVE_PUBLISH_DELAY_SECS = 30
+MAX_ARCHIVE_UPLOAD_ATTEMPTS = 5
+
+# The pages are stored gzipped unless ARCHIVE_GZIP=0; GCS unzips them for any reader which can't take it that way.
+ARCHIVE_GZIP = os.getenv("ARCHIVE_GZIP", "1") == "1"
+# An edition can be republished during its day, the indexes change with every edition, so neither is cached long
+EDITION_CACHE_CONTROL = "public, max-age=300"
+INDEX_CACHE_CONTROL = "public, max-age=60"
+
+# in the order they're published in a day, so the index pages can list a day's editions latest first
+PARTS_OF_DAY = editions['en'] + ["Heb Daily Summary"]
+
+ARCHIVE_TITLES = {'he': "הארכיון של תמצית החדשות",
+                  'en': "Tamtzit HaChadashot Archive",
+                  'fr': "Tamtzit HaChadashot Archive"}
+
+EARLIER_EDITIONS = {'he': "מהדורות קודמות", 'en': "Earlier editions", 'fr': "Éditions précédentes"}
+
+# the same as the original archive-{lang}.html pages (see the archive directory), for a consistent look -
+# but without tamtzit-common.js, which they needed to format the editions
+ARCHIVE_PAGE_SKELETON = """<html>
+<head>
+    <meta charset="utf-8">
+    <link rel="shortcut icon" href="https://tamtzit-hadashot.lm.r.appspot.com/static/favicon.png">
+    <title></title>
+</head>
+<body>
+<center><h2></h2>
+<div id="next-entry"></div>
+
+</center>
+</body>
+</html>
+"""
+
+storage_client = storage.Client()
+archive_bucket = storage_client.bucket("tamtzit-archive")
+
+datastore_client = DatastoreClientProxy.get_instance()
+log = get_logger(__name__)
+
+
+def edition_object_name(lang_code, anchor):
+    return f"archive/{lang_code}/{anchor}.html"
+
+
+def month_index_object_name(lang_code, month):
+    return f"archive/{lang_code}/months/{month}.html"
+
+
+def months_index_object_name(lang_code):
+    return f"archive/{lang_code}/index.html"
+
+
+def edition_json_object_name(lang_code, anchor):
+    return f"archive/{lang_code}/json/{anchor}.json"
+
+
+def search_index_object_name(lang_code, month):
+    return f"archive/{lang_code}/search/{month}.json"
+
+
+def archive_url(object_name):
+    # anchors can have spaces in them, e.g. "Heb Daily Summary"
+    return ARCHIVE_BASE + quote(object_name)
+
+
+def anchor_sort_key(anchor):
+    # anchors are {YYYY-MM-DD}-{part of day}
+    part_of_day = anchor[11:]
+    return anchor[:10], PARTS_OF_DAY.index(part_of_day) if part_of_day in PARTS_OF_DAY else len(PARTS_OF_DAY)
+
+
+def edition_text(draft, lang_code):
+    return draft['hebrew_text'] if lang_code == 'he' else draft['translation_text']
+
+
+# the same formatting as makeWhatsappPreview() in static/tamtzit-common.js, which the editing pages use, so the
+# patterns follow Javascript's rules rather than Python's: its \s is a slightly different set of characters, and
+# it counts an emoji (or any character outside the BMP) as two characters, so "*📌*" is long enough to be bold
+JS_WHITESPACE = "\t\n\v\f\r \u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000\ufeff"
+JS_NON_WHITESPACE_START = f"(?:[\U00010000-\U0010FFFF]|[^{JS_WHITESPACE}][^\n])"
+whatsapp_bold_pat = re.compile(f"\\*({JS_NON_WHITESPACE_START}[^\n]*?)\\*")
+whatsapp_italic_pat = re.compile(f"_({JS_NON_WHITESPACE_START}[^\n]*?)_")
+whatsapp_link_pat = re.compile(f"(https://[^{JS_WHITESPACE}]+)")
+
+
+def make_whatsapp_preview(text):
+    # unlike the browser version, the text is HTML-escaped first - it's plain text, not markup
+    result = html.escape(text)
+    result = whatsapp_bold_pat.sub(r"<b>\1</b>", result)
+    result = whatsapp_italic_pat.sub(r"<i>\1</i>", result)
+    result = result.replace("\n", "<br>")
+    result = whatsapp_link_pat.sub(r'<a href="\1">\1</a>', result)
+    result = result.replace("++++++++++++++++++++++++++", "")
+    return result
+
+
+# must split text into words the same way as the search box's script, see SEARCH_SCRIPT
+search_word_pat = re.compile(r"\w+")
+
+
+def search_words(text):
+    return {word for word in search_word_pat.findall(text.lower()) if len(word) > 1}
+
+
+def new_archive_page(lang_code, heading):
+    soup = BeautifulSoup(ARCHIVE_PAGE_SKELETON, "html.parser")
+    soup.title.string = ARCHIVE_TITLES[lang_code]
+    soup.h2.string = heading
+    return soup, soup.find(id='next-entry')
+
+
+def make_new_archive_entry(soup, next_entry_tag, draft, anchor, lang_code):
+    new_entry = soup.new_tag("div")
+    new_entry.attrs['id'] = anchor
+    next_entry_tag.insert_after("\n\n", new_entry)
+
+    table_tag = soup.new_tag("table")
+    table_tag.attrs['border'] = '4'
+    table_tag.attrs['width'] = '750px'
+    table_tag.attrs['cellpadding'] = '20px'
+    new_entry.append(table_tag)
+
+    tr_tag = soup.new_tag("tr")
+    table_tag.append(tr_tag)
+
+    td_tag = soup.new_tag("td")
+    td_tag.attrs['id'] = anchor + "-td"
+    if lang_code == 'he':
+        td_tag.attrs['dir'] = 'rtl'
+        td_tag.attrs['align'] = 'right'
+    tr_tag.append(td_tag)
+
+    # formatted here rather than by a script in the page, so the browser can show it straight away
+    td_tag.append(BeautifulSoup(make_whatsapp_preview(edition_text(draft, lang_code)), "html.parser"))
+
+    other_langs_div = soup.new_tag("div")
+    other_langs_div.attrs['id'] = anchor + "-other-langs"
+    other_langs_div.attrs['style'] = "padding-top: 10px; font-weight: bold;"
+    other_langs_div.string = "Other Languages:"
+    new_entry.append("\n")
+    new_entry.append(other_langs_div)
+
+    section_divider_tag = soup.new_tag("hr")
+    new_entry.insert_after(section_divider_tag)
+
+    for other_lang_code, other_lang_name in [('fr', 'French'), ('en', 'English'), ('he', 'Hebrew')]:
+        if other_lang_code == lang_code:
+            continue
+        link_tag = soup.new_tag("a")
+        link_tag.attrs['href'] = archive_url(edition_object_name(other_lang_code, anchor))
+        link_tag.attrs['style'] = "padding-left: 20px;"
+        link_tag.string = other_lang_name
+        other_langs_div.append(link_tag)
+
+
+def make_archive_link_list(soup, next_entry_tag, links):
+    # links is a list of (text, url), in the order they should appear
+    list_tag = soup.new_tag("div")
+    list_tag.attrs['dir'] = 'ltr'
+    for text, url in links:
+        link_tag = soup.new_tag("a")
+        link_tag.attrs['href'] = url
+        link_tag.string = text
+        list_tag.append(link_tag)
+        list_tag.append(soup.new_tag("br"))
+        list_tag.append("\n")
+    next_entry_tag.insert_after("\n", list_tag)
+
+
+def render_edition_page(draft, anchor, lang_code):
+    soup, next_entry_tag = new_archive_page(lang_code, ARCHIVE_TITLES[lang_code])
+    make_new_archive_entry(soup, next_entry_tag, draft, anchor, lang_code)
+    index_link = soup.new_tag("a")
+    index_link.attrs['href'] = archive_url(month_index_object_name(lang_code, anchor[:7]))
+    index_link.string = anchor[:7]
+    next_entry_tag.insert_after(index_link)
+    return str(soup)
+
+
+def render_month_index(lang_code, month, anchors):
+    soup, next_entry_tag = new_archive_page(lang_code, f"{ARCHIVE_TITLES[lang_code]} - {month}")
+    make_archive_link_list(soup, next_entry_tag,
+                           [(anchor, archive_url(edition_object_name(lang_code, anchor)))
+                            for anchor in sorted(anchors, key=anchor_sort_key, reverse=True)])
+    return str(soup)
+
+
+def render_months_index(lang_code, months):
+    soup, next_entry_tag = new_archive_page(lang_code, ARCHIVE_TITLES[lang_code])
+    months = sorted(months, reverse=True)
+    links = [(month, archive_url(month_index_object_name(lang_code, month))) for month in months]
+    # the editions from before we kept them like this
+    links.append((EARLIER_EDITIONS[lang_code], f"{ARCHIVE_BASE}archive-{lang_code}.html"))
+    make_archive_link_list(soup, next_entry_tag, links)
+    make_search_box(soup, next_entry_tag, lang_code, months)
+    return str(soup)
+
+
+# Searching, in the browser: each word of the query must appear in an edition, as a word or the start of one.
+# The months' search indexes are fetched latest first, and the results shown as each one comes in.
+SEARCH_SCRIPT = """
+const searchIndexes = {};
+
+function searchWords(text) {
+    return (text.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || []).filter(word => word.length > 1);
+}
+
+async function searchArchive() {
+    const queryWords = searchWords(document.getElementById('archive-search-query').value);
+    const results = document.getElementById('archive-search-results');
+    results.innerHTML = '';
+    if (queryWords.length == 0) {
+        return;
+    }
+    for (const month of ARCHIVE_MONTHS) {
+        if (!(month in searchIndexes)) {
+            const response = await fetch(ARCHIVE_SEARCH_BASE + month + '.json');
+            searchIndexes[month] = response.ok ? await response.json() : {words: {}};
+        }
+        const indexWords = Object.keys(searchIndexes[month].words);
+        let found = null;
+        for (const queryWord of queryWords) {
+            const editions = new Set();
+            for (const word of indexWords.filter(word => word.startsWith(queryWord))) {
+                searchIndexes[month].words[word].forEach(anchor => editions.add(anchor));
+            }
+            found = found === null ? editions : new Set([...found].filter(anchor => editions.has(anchor)));
+        }
+        for (const anchor of [...found].sort().reverse()) {
+            const link = document.createElement('a');
+            link.href = ARCHIVE_EDITION_BASE + encodeURIComponent(anchor) + '.html';
+            link.textContent = anchor;
+            results.append(link, document.createElement('br'));
+        }
+    }
+}
+"""
+
+
+def make_search_box(soup, next_entry_tag, lang_code, months):
+    search_div = soup.new_tag("div")
+    search_div.attrs['dir'] = 'rtl' if lang_code == 'he' else 'ltr'
+    search_div.attrs['style'] = "padding-bottom: 20px;"
+
+    query_tag = soup.new_tag("input")
+    query_tag.attrs['id'] = 'archive-search-query'
+    query_tag.attrs['type'] = 'text'
+    query_tag.attrs['onkeydown'] = "if (event.key == 'Enter') searchArchive();"
+    search_div.append(query_tag)
+
+    button_tag = soup.new_tag("button")
+    button_tag.attrs['onclick'] = "searchArchive();"
+    button_tag.string = "🔍"
+    search_div.append(button_tag)
+
+    results_tag = soup.new_tag("div")
+    results_tag.attrs['id'] = 'archive-search-results'
+    results_tag.attrs['dir'] = 'ltr'
+    search_div.append(results_tag)
+
+    script_tag = soup.new_tag("script")
+    script_tag.string = (f"const ARCHIVE_MONTHS = {json.dumps(months)};\n"
+                         f"const ARCHIVE_SEARCH_BASE = '{archive_url(search_index_object_name(lang_code, ''))[:-len('.json')]}';\n"
+                         f"const ARCHIVE_EDITION_BASE = '{archive_url(edition_object_name(lang_code, ''))[:-len('.html')]}';\n"
+                         + SEARCH_SCRIPT)
+    search_div.append(script_tag)
+    next_entry_tag.insert_after("\n", search_div)
+
+
+def render_edition_json(draft, anchor, lang_code):
+    return json.dumps({"lang": lang_code, "anchor": anchor, "date": anchor[:10], "part_of_day": anchor[11:],
+                       "text": edition_text(draft, lang_code)}, ensure_ascii=False, separators=(",", ":"))
+
+
+def update_search_index(lang_code, month, added_texts=None, removed_anchors=()):
+    # added_texts is {anchor: text} of editions (re)published, removed_anchors those taken out of the archive
+    added_texts = added_texts or {}
+
+    def make_search_index():
+        blob = archive_bucket.get_blob(search_index_object_name(lang_code, month))
+        words = json.loads(blob.download_as_text())["words"] if blob else {}
+        changed_anchors = set(added_texts) | set(removed_anchors)
+        words = {word: [anchor for anchor in anchors if anchor not in changed_anchors] for word, anchors in words.items()}
+        for anchor, text in added_texts.items():
+            for word in search_words(text):
+                words.setdefault(word, []).append(anchor)
+        return json.dumps({"month": month, "words": {word: anchors for word, anchors in words.items() if anchors}},
+                          ensure_ascii=False, separators=(",", ":"))
+
+    upload_unless_changed(search_index_object_name(lang_code, month), make_search_index,
+                          content_type="application/json")
+
+
+def list_anchors(lang_code, date_prefix):
+    # the editions of one month (YYYY-MM) or day (YYYY-MM-DD): only the objects with that prefix are listed,
+    # so this stays small however big the archive gets
+    prefix = f"archive/{lang_code}/{date_prefix}-"
+    return [blob.name[len(f"archive/{lang_code}/"):-len(".html")] for blob in archive_bucket.list_blobs(prefix=prefix)]
+
+
+def list_months(lang_code):
+    prefix = f"archive/{lang_code}/months/"
+    return [blob.name[len(prefix):-len(".html")] for blob in archive_bucket.list_blobs(prefix=prefix)]
+
+
+def regenerate_month_index(lang_code, month):
+    is_new_month = upload_unless_changed(month_index_object_name(lang_code, month),
+                                         lambda: render_month_index(lang_code, month, list_anchors(lang_code, month)))
+    if is_new_month:
+        log.debug("%s archive: first edition of %s, updating the list of months", lang_code, month)
+        upload_unless_changed(months_index_object_name(lang_code), lambda: render_months_index(lang_code, list_months(lang_code)))
+
+
+def upload_unless_changed(file_name, make_content, content_type="text/html; charset=utf-8"):
+    # For pages built from what's in the bucket (the indexes, and search indexes), when two editions are being published at once:
+    # make_content() must look at the bucket afresh each time it's called. We note the page's generation before
+    # calling it, and only upload if the page is still that generation. If it isn't, someone else uploaded it
+    # in the meantime, maybe without knowing about our edition - so we go round again and rebuild it.
+    # Returns True if the page didn't exist before.
+    for attempt in range(1, MAX_ARCHIVE_UPLOAD_ATTEMPTS + 1):
+        blob = archive_bucket.get_blob(file_name)
+        generation = blob.generation if blob else 0   # 0 means it must not exist yet
+        try:
+            upload_to_cloud_storage(file_name, make_content(), content_type=content_type,
+                                    cache_control=INDEX_CACHE_CONTROL, if_generation_match=generation)
+            return generation == 0
+        except PreconditionFailed:
+            log.debug("upload_unless_changed: %s changed under us (attempt %s), rebuilding it", file_name, attempt)
+            if attempt == MAX_ARCHIVE_UPLOAD_ATTEMPTS:
+                raise
+
+
+def publish_edition(draft, anchor, lang_code, update_index=True):
+    # update_index=False lets a caller publishing a batch of editions regenerate each month's index just once
+    upload_to_cloud_storage(edition_object_name(lang_code, anchor), render_edition_page(draft, anchor, lang_code),
+                            cache_control=EDITION_CACHE_CONTROL)
+    upload_to_cloud_storage(edition_json_object_name(lang_code, anchor), render_edition_json(draft, anchor, lang_code),
+                            content_type="application/json", cache_control=EDITION_CACHE_CONTROL)
+    if update_index:
+        regenerate_month_index(lang_code, anchor[:7])
+        update_search_index(lang_code, anchor[:7], {anchor: edition_text(draft, lang_code)})
+
+
+def republish_day(lang_code, day, editions_by_time_of_day):
+    # for the nightly cleanup: editions_by_time_of_day holds the most mature draft of each of the day's editions
+    log.debug("republish_day: cleaning up %s archive for %s", lang_code, day)
+
+    # step 1: remove the day's editions which weren't the final version of an edition,
+    # e.g. one published under the wrong part of the day
+    anchors = {edition['timestamp'].astimezone(JERUSALEM_TZ).strftime('%Y-%m-%d') + '-' + edition_time_of_day: edition
+               for edition_time_of_day, edition in editions_by_time_of_day.items()}
+    # - but if we found none of the day's drafts, that says more about the lookup than the archive, keep it all
+    if anchors:
+        removed_anchors = [anchor for anchor in list_anchors(lang_code, day) if anchor not in anchors]
+    else:
+        log.warning("republish_day: no %s editions found for %s, not removing any from the archive", lang_code, day)
+        removed_anchors = []
+    for anchor in removed_anchors:
+        log.debug("republish_day: deleting %s %s", lang_code, anchor)
+        unpublish_edition(lang_code, anchor)
+
+    # step 2: publish the most mature version of each edition
+    for anchor, edition in anchors.items():
+        publish_edition(edition, anchor, lang_code, update_index=False)
+        log.debug("republish_day: published %s %s", lang_code, anchor)
+
+    # step 3: bring the index pages up to date, once for all the above
+    for month in {day[:7]} | {anchor[:7] for anchor in anchors}:
+        regenerate_month_index(lang_code, month)
+        update_search_index(lang_code, month,
+                            {anchor: edition_text(edition, lang_code) for anchor, edition in anchors.items()
+                             if anchor.startswith(month)},
+                            [anchor for anchor in removed_anchors if anchor.startswith(month)])
+
+
+def unpublish_edition(lang_code, anchor):
+    # editions published before we kept JSON copies won't have one, so don't mind if it's not there
+    archive_bucket.delete_blobs([edition_object_name(lang_code, anchor), edition_json_object_name(lang_code, anchor)],
+                                on_error=lambda blob: None)
+
+
+def archive_publish_key(lang_code, anchor):
+    return datastore_client.key("archive_publish", f"{lang_code}-{anchor}")
+
+
+def request_archive_publish(draft, anchor, lang_code):
+    # The request is an archive_publish entity, one per edition (lang and anchor), saying which draft to publish -
+    # a later request for the same edition just replaces it. The publishing is done by a deferred task,
+    # named for the edition and the current ARCHIVE_PUBLISH_DELAY_SECS window, which waits out the window:
+    # any more requests for that edition in the window find the task already there, and it publishes whatever
+    # the latest request is when it runs. If it fails, the task queue retries it.
+    entity = datastore.Entity(key=archive_publish_key(lang_code, anchor))
+    entity.update({"draft_id": draft.key.id, "lang": lang_code, "anchor": anchor,
+                   "requested_at": datetime.now(tz=JERUSALEM_TZ)})
+    datastore_client.put(entity)
+    schedule_archive_publish(lang_code, anchor)
+
+
+def schedule_archive_publish(lang_code, anchor):
+    window = int(time.time() // ARCHIVE_PUBLISH_DELAY_SECS)
+    task_name = re.sub(r"[^a-zA-Z0-9_-]", "_", f"archive-{lang_code}-{anchor}-{window}")
+    try:
+        deferred.defer(publish_requested_edition, lang_code, anchor,
+                       _name=task_name, _countdown=ARCHIVE_PUBLISH_DELAY_SECS)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        log.debug("schedule_archive_publish: %s already scheduled, it will publish the latest request", task_name)
+
+
+def publish_requested_edition(lang_code, anchor):
+    key = archive_publish_key(lang_code, anchor)
+    publish_request = datastore_client.get(key)
+    if publish_request is None:
+        log.debug("publish_requested_edition: nothing waiting for %s %s, must have been done already", lang_code, anchor)
+        return
+    draft = datastore_client.get(datastore_client.key("draft", publish_request["draft_id"]))
+    if draft is None:
+        log.warning("publish_requested_edition: draft %s is gone, not archiving %s", publish_request['draft_id'], anchor)
+    else:
+        publish_edition(draft, anchor, lang_code)
+
+    # done - unless another request came in while we were publishing. That request scheduled its own task, which
+    # will publish it; scheduling the same way here only adds a task if (somehow) there isn't one for this window
+    with datastore_client.transaction():
+        latest_request = datastore_client.get(key)
+        if latest_request is None or latest_request["requested_at"] == publish_request["requested_at"]:
+            if latest_request is not None:
+                datastore_client.delete(key)
+            return
+    schedule_archive_publish(lang_code, anchor)
+
+
+############################################
+# Notes on use of GCP Cloud Storage (GCS)
+#   
+# For downloading a file:
+# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_download_file.py
+# 
+# For uploading a file:
+# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_upload_file.py
+# or to upload from memory:
+# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_upload_from_memory.py
+# or from a stream:
+# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_upload_from_stream.py
+# 
+def upload_to_cloud_storage(file_name, text_content, content_type="text/html; charset=utf-8",
+                            cache_control=INDEX_CACHE_CONTROL, if_generation_match=None):
+    # all the metadata is set before uploading so it goes in the same request as the content
+    blob = archive_bucket.blob(file_name)
+    blob.cache_control = cache_control
+    data = text_content.encode()
+    if ARCHIVE_GZIP:
+        blob.content_encoding = "gzip"
+        data = gzip.compress(data)
+    blob.upload_from_string(data, content_type=content_type, if_generation_match=if_generation_match)
+    log.debug("DONE uploading %s (%s bytes)", file_name, len(data))
@@ -0,0 +1,133 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+############################################
+# Creating async_job entities for the async processor (see async/job_queue.py)
+#
+# Besides the jobs a translator asks for from input.html, as soon as a Hebrew draft is marked ok-to-translate we
+# create a "speculative" job for each language OpenAI translates into. By the time a translator gets to
+# /translate it has usually finished, and they go straight to the draft instead of waiting on async_pending.html.
+# Any changes made to the Hebrew after that point show up in the translator's delta view as usual, since
+# the translation draft records the Hebrew text the job actually translated. A job is only reused if the translator
+# is translating exactly the text it did, see get_reusable_speculative_job().
+
+from datetime import datetime
+import os
+
+from google.cloud import datastore
+from google.cloud.datastore.query import PropertyFilter
+import requests
+
+from common import AsyncJobStatus, DatastoreClientProxy, get_logger, JERUSALEM_TZ
+from glossary import get_glossary
+
+# should match the first (default) OpenAI option in input.html, otherwise translators won't benefit
+SPECULATIVE_TRANSLATION_MODEL = os.getenv("SPECULATIVE_TRANSLATION_MODEL", "gpt-5")
+
+datastore_client = DatastoreClientProxy.get_instance()
+log = get_logger(__name__)
+
+
+def create_async_translation_job(heb_text, target_language_code, openai_model, heb_draft_id, heb_author_id,
+                                 created_by, custom_dirs="", speculative=False):
+    key = datastore_client.key("async_job")
+    entity = datastore.Entity(key=key, exclude_from_indexes=("translation_result", "translation_partial",
+                                                             "translation_custom_dirs", "heb_text"))
+    entity.update({"created_at": datetime.now(tz=JERUSALEM_TZ),
+                   "created_by": created_by,
+                   "operation": "translation",
+                   "translation_lang": target_language_code,
+                   "heb_draft_id": str(heb_draft_id),
+                   "heb_author_id": heb_author_id,
+                   "heb_text": heb_text,
+                   "translation_engine": "openai/" + openai_model,
+                   "translation_custom_dirs": custom_dirs,
+                   "translation_result": "",  # necessary to get it to save exclude from indexes
+                   "translation_partial": "",  # filled in periodically while OpenAI streams its output
+                   "translation_progress": 0,
+                   "speculative": speculative,
+                   "job_status": AsyncJobStatus.QUEUED.name,  # the async processor takes it from here
+                   "attempts": 0
+                   })
+    datastore_client.put(entity)
+    entity = datastore_client.get(entity.key)
+    notify_async_processor(entity.key.id)
+    return entity
+
+
+def notify_async_processor(job_id):
+    # call an endpoint exposed by the async processor to let it know there's a pending request.
+    # If this fails the job isn't lost, the processor's sweeper will find it - just not as quickly.
+    log.debug("notify_async_processor: calling requests.get(%s%s)", os.getenv('ASYNC_PROCESSOR_URL'), job_id)
+    try:
+        requests.get(f"{os.getenv('ASYNC_PROCESSOR_URL')}{job_id}", timeout=10)
+    except requests.RequestException as err:
+        log.warning("notify_async_processor: unable to reach the async processor about job %s: %s", job_id, err)
+
+
+def find_speculative_translation_job(heb_draft_id, target_language_code):
+    query = datastore_client.query(kind="async_job")
+    query.add_filter(filter=PropertyFilter("heb_draft_id", "=", str(heb_draft_id)))
+    query.add_filter(filter=PropertyFilter("translation_lang", "=", target_language_code))
+    query.add_filter(filter=PropertyFilter("speculative", "=", True))
+    for job in query.fetch(limit=1):
+        return job
+    return None
+
+
+def enqueue_speculative_translations(heb_draft_id):
+    # run via deferred when a Hebrew draft becomes ok-to-translate, so that creating the jobs and notifying the
+    # async processor (which can be slow) doesn't hold up the editor's save
+    heb_draft = datastore_client.get(datastore_client.key("draft", int(heb_draft_id)))
+    if heb_draft is None or heb_draft["translation_lang"] != '--':
+        return   # only Hebrew drafts get translated
+    # the languages we have OpenAI prompts for; the others (e.g. Youth) aren't machine translated that way
+    for lang in get_glossary()["openai_prompts"]:
+        if find_speculative_translation_job(heb_draft.key.id, lang):
+            continue
+        log.debug("enqueue_speculative_translations: starting %s translation of draft %s", lang, heb_draft.key.id)
+        try:
+            create_async_translation_job(heb_draft["hebrew_text"], lang, SPECULATIVE_TRANSLATION_MODEL,
+                                         heb_draft_id=heb_draft.key.id, heb_author_id=str(heb_draft["created_by"]),
+                                         created_by="speculative", speculative=True)
+        except Exception:  # noqa - this is only an optimization, one language failing mustn't stop the others
+            log.exception("enqueue_speculative_translations: failed to create %s job", lang)
+
+
+def normalize_heb_text(heb_text):
+    # the text as submitted from a form has \r\n line endings
+    return (heb_text or "").replace("\r\n", "\n").strip()
+
+
+def get_reusable_speculative_job(heb_draft_id, target_language_code, openai_model, custom_dirs, heb_text):
+    # a speculative job is only a substitute for what the translator asked for if it's the same request,
+    # on the same Hebrew text - it may have changed since the job was started
+    if custom_dirs or not heb_draft_id:
+        return None
+    job = find_speculative_translation_job(heb_draft_id, target_language_code)
+    if (job is None or job["translation_engine"] != "openai/" + openai_model or
+            job.get("job_status") == AsyncJobStatus.DEAD.name or
+            normalize_heb_text(job["heb_text"]) != normalize_heb_text(heb_text)):
+        return None
+    return job
@@ -0,0 +1,83 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+############################################
+# Machine translations of single bullets, kept in the DB as bullet_translation entities
+#
+# After the Hebrew is ok-to-translate, every save of it can add or change bullets which the translators
+# are shown (translated) in their delta view. Rather than translate them one at a time when the translator's
+# page asks for them, we translate them in the background when the Hebrew is saved, and keep the result.
+#
+# The key is the language, the glossary version and a hash of the exact bullet text, so a bullet is only ever
+# translated once per language no matter how many translation drafts or saves it shows up in, and any edit to a
+# bullet makes it a new bullet - as does a new glossary, whose swaps may translate it differently.
+# created_at is there so a TTL policy can clear out old entries.
+
+from datetime import datetime
+import hashlib
+
+from google.cloud import datastore
+
+from common import DatastoreClientProxy, get_logger, JERUSALEM_TZ
+from glossary import get_glossary
+from translation_utils import google_translate_batch
+
+datastore_client = DatastoreClientProxy.get_instance()
+log = get_logger(__name__)
+
+
+def bullet_translation_key(bullet, lang, glossary_version):
+    return datastore_client.key("bullet_translation",
+                                f"{lang}-{glossary_version}-{hashlib.sha256(bullet.encode()).hexdigest()}")
+
+
+def get_cached_bullet_translations(bullets, lang, glossary_version):
+    # returns a dict of bullet -> translation, for those bullets which have already been translated
+    keys = {bullet_translation_key(bullet, lang, glossary_version): bullet for bullet in set(bullets)}
+    if not keys:
+        return {}
+    return {keys[entity.key]: entity["translation"] for entity in datastore_client.get_multi(list(keys))}
+
+
+def translate_bullets(bullets, lang):
+    # returns a dict of bullet -> translation; only bullets we've never seen before are sent for translation,
+    # all of them together in as few calls as possible
+    glossary_version = get_glossary()["version"]
+    translations = get_cached_bullet_translations(bullets, lang, glossary_version)
+    missing = [bullet for bullet in dict.fromkeys(bullets) if bullet not in translations]
+    log.debug("translate_bullets: %s bullets already translated to %s, %s to go", len(translations), lang, len(missing))
+    if not missing:
+        return translations
+
+    now = datetime.now(tz=JERUSALEM_TZ)
+    entities = []
+    for bullet, translation in zip(missing, google_translate_batch(missing, lang)):
+        translations[bullet] = translation
+        entity = datastore.Entity(key=bullet_translation_key(bullet, lang, glossary_version),
+                                  exclude_from_indexes=("hebrew_text", "translation"))
+        entity.update({"hebrew_text": bullet, "translation": translation, "glossary_version": glossary_version,
+                       "created_at": now})
+        entities.append(entity)
+    datastore_client.put_multi(entities)
+    return translations
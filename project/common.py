@@ -26,7 +26,9 @@ from google.cloud import datastore
 from pyluach import dates
 from pyluach.utils import Transliteration
 
+import logging
 import os
+import sys
 from babel.dates import format_date
 from dataclasses import dataclass
 from datetime import datetime
@@ -45,6 +47,55 @@ JERUSALEM_TZ = ZoneInfo("Asia/Jerusalem")
 
 debug_state = os.getenv("FLASK_DEBUG") == "1"
 
+############################################
+# Logging
+#
+# Each module has its own logger:  log = get_logger(__name__)
+# and passes the values to log separately rather than in an f-string, so that nothing is formatted - not even
+# a whole edition's text - unless that level is enabled for that module:
+#   log.debug("draft %s has %s sections", draft_id, len(sections))
+#   log.debug("parsed: %s", lazy(lambda: expensive_summary(text)))   <- not even called unless enabled
+# Everything logs at INFO and up, or DEBUG in debug mode (FLASK_DEBUG=1, or /set-debug-mode), except for modules
+# given their own level in LOG_LEVELS, e.g. LOG_LEVELS="draft_utils=DEBUG,auth_utils=WARNING"
+# The older debug() below still works, it's the same as debug mode logging from no module in particular.
+
+
+class JerusalemTimeFormatter(logging.Formatter):
+    def formatTime(self, record, datefmt=None):
+        return datetime.fromtimestamp(record.created, tz=JERUSALEM_TZ).strftime('%d/%m/%Y %H:%M:%S')
+
+
+class lazy:
+    # a log argument which is only worked out if the message is actually logged
+    def __init__(self, function) -> None:
+        self.function = function
+
+    def __str__(self):
+        return str(self.function())
+
+
+def get_logger(module_name):
+    # module_name is usually __name__, which can be e.g. "draft_utils" or "project.draft_utils"
+    return logging.getLogger("tetrec." + module_name.rsplit(".", 1)[-1])
+
+
+def _configure_logging():
+    root_logger = logging.getLogger("tetrec")
+    if root_logger.handlers:
+        return root_logger
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JerusalemTimeFormatter("%(levelname)s: [%(asctime)s] %(message)s"))
+    root_logger.addHandler(handler)
+    root_logger.propagate = False   # App Engine / gunicorn may have set up their own root handlers
+    root_logger.setLevel(logging.DEBUG if debug_state else logging.INFO)
+    for module_level in filter(None, os.getenv("LOG_LEVELS", "").split(",")):
+        module_name, level = module_level.split("=")
+        get_logger(module_name.strip()).setLevel(level.strip().upper())
+    return root_logger
+
+
+_debug_logger = _configure_logging()
+
 
 def _set_debug(new_state):
     global debug_state
@@ -52,13 +103,14 @@ def _set_debug(new_state):
         debug_state = new_state
     else:
         debug_state = type(new_state) is str and new_state.lower() in ['on', 'true', 'debug', "1"]
+    _debug_logger.setLevel(logging.DEBUG if debug_state else logging.INFO)
     return debug_state
 
 
-def debug(stuff):
-    if debug_state:
-        now = datetime.now(tz=ZoneInfo("Asia/Jerusalem"))
-        print(f"DEBUG: [{now.strftime('%d/%m/%Y %H:%M:%S')}] {stuff}")
+def debug(stuff, *args):
+    # in hot code, pass the values as args (debug("%d: %s", len(line), line)) rather than an f-string,
+    # so nothing gets formatted unless debug is on - or better, use a module logger as above
+    _debug_logger.debug(stuff, *args)
 
 
 def expand_lang_code(from_lang, to_lang='H'):
@@ -95,17 +147,34 @@ class DraftStates(Enum):
     ADMIN_CLOSED = auto()
 
 
-def compare_draft_state_lists(dict_of_states1, dict_of_states2):
-    states_in_order = [DraftStates.PUBLISHED, DraftStates.PUBLISH_READY, DraftStates.EDIT_NEAR_DONE,
-                       DraftStates.EDIT_ONGOING, DraftStates.EDIT_READY, DraftStates.WRITING]
-    for state in states_in_order:
-        if state in dict_of_states1:
-            if state in dict_of_states2:
-                return 0
-            return -1
-        if state in dict_of_states2:
-            return 1
-        
+class AsyncJobStatus(Enum):
+    # lifecycle of an async_job entity as it moves through the async processor's queue
+    QUEUED = auto()
+    LEASED = auto()
+    DONE = auto()
+    DEAD = auto()     # gave up after too many failed attempts
+
+
+# least to most mature; ADMIN_CLOSED isn't a step on the way to publishing, so doesn't count
+DRAFT_STATES_BY_MATURITY = [DraftStates.WRITING, DraftStates.EDIT_READY, DraftStates.EDIT_ONGOING,
+                            DraftStates.EDIT_NEAR_DONE, DraftStates.PUBLISH_READY, DraftStates.PUBLISHED]
+MATURITY_RANK_BY_STATE_NAME = {state.name: rank for rank, state in enumerate(DRAFT_STATES_BY_MATURITY, start=1)}
+
+
+def draft_maturity_rank(states):
+    # states is a draft's "states" list; the rank of the most mature state it has reached, 0 if none
+    return max((MATURITY_RANK_BY_STATE_NAME.get(states_entry["state"], 0) for states_entry in states), default=0)
+
+
+def compare_draft_state_lists(states1, states2):
+    # -1 if the first list of states is more mature, 1 if the second, 0 if they're the same
+    rank1, rank2 = draft_maturity_rank(states1), draft_maturity_rank(states2)
+    if rank1 > rank2:
+        return -1
+    if rank1 < rank2:
+        return 1
+    return 0
+
 
 class DatastoreClientProxy:
 
@@ -135,9 +204,19 @@ class DatastoreClientProxy:
     
     def get(self, key):
         return self.client.get(key)
+
+    def put_multi(self, entities):
+        return self.client.put_multi(entities)
+
+    def get_multi(self, keys):
+        return self.client.get_multi(keys)
     
     def delete(self, key):
         return self.client.delete(key)
+
+    def transaction(self):
+        # use as a context manager; gets and puts made inside the "with" block are part of the transaction
+        return self.client.transaction()
     
     def query(self, kind):
         return self.client.query(kind=("debug_" if self.debug_mode else "") + kind)
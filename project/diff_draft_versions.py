@@ -23,40 +23,34 @@
 #################################################################################
 
 from difflib import SequenceMatcher
-import re
 from collections import defaultdict
+from google.cloud.datastore.query import PropertyFilter
 from common import *
-from translation_utils import translate_text
+from bullet_translations import translate_bullets
 from language_mappings import sections
+from parsed_edition import get_parsed_edition
 
+log = get_logger(__name__)
+
+
+# a bullet counts as added if it doesn't resemble any bullet in the same section of the backup
+SUBSTANTIAL_CHANGE_RATIO = 0.66
 
-def parse_for_comparison(text):
-    result = defaultdict(list)
-    section = None
-    current_entry = None
-    for line in text:
-        line = line.strip()
-        if len(line.replace("•", "").strip()) == 0:
-            # print(f"skipping a blank line: {line}")
-            current_entry = None
-            continue
-        # two consecutive lines not separated by a blank line will be considered the same entry
-        if not re.match("^[•📌>-]", line):  # it doesn't start with any prefix
-            if current_entry:
-                result[section][-1] = result[section][-1] + "\n" + line
-                # print("Appending this line to the previous one")
-                # else:
-                # print(f"skipping a no-prefix non-blank line: {line}")
-        elif not (line.startswith("•") or line.startswith("-")):
-            section = line  # this should always get replaced, but just in case...
-            for heb_section in sections['keys_from_Hebrew']:
-                if heb_section in line:
-                    section = heb_section
-                    break
-        else:
-            current_entry = line
-            result[section].append(current_entry)
-    return result
+
+def is_substantially_new(bullet, backup_section, backup_bullet_set):
+    # same result as checking max(ratio()) against the threshold for every backup bullet, but much cheaper:
+    # an unchanged bullet is found by hashing, and real_quick_ratio() and quick_ratio() are upper bounds
+    # on ratio(), so whenever either is already below the threshold the expensive ratio() can't reach it
+    if bullet in backup_bullet_set:
+        return False
+    matcher = SequenceMatcher(None, "", bullet)   # the bullet is seq2, which SequenceMatcher analyzes only once
+    for backup_bullet in backup_section:
+        matcher.set_seq1(backup_bullet)
+        if (matcher.real_quick_ratio() >= SUBSTANTIAL_CHANGE_RATIO and
+                matcher.quick_ratio() >= SUBSTANTIAL_CHANGE_RATIO and
+                matcher.ratio() >= SUBSTANTIAL_CHANGE_RATIO):
+            return False
+    return True
 
 
 def get_substantial_additions(parsed_heb_draft, parsed_backup):
@@ -64,16 +58,16 @@ def get_substantial_additions(parsed_heb_draft, parsed_backup):
 
     for section in parsed_heb_draft:
         if section not in parsed_backup:
-            debug(f"The section {section} is entirely missing from the backup")
+            log.debug("The section %s is entirely missing from the backup", section)
             additions[section] = parsed_heb_draft[section]
             continue
         backup_section = parsed_backup[section]
+        backup_bullet_set = set(backup_section)
         for bullet in parsed_heb_draft[section]:
             if len(bullet) < 5:
                 continue
-            best_fit = max([SequenceMatcher(None, backup_bullet, bullet).ratio() for backup_bullet in backup_section])
-            if best_fit < 0.66:
-                # print(f"More than one third ({best_fit}) has been changed, let's consider it added to {section}:")
+            if is_substantially_new(bullet, backup_section, backup_bullet_set):
+                # print(f"More than one third has been changed, let's consider it added to {section}:")
                 # print(bullet)
                 additions[section].append(bullet)
     return additions
@@ -85,49 +79,82 @@ def get_pre_translation_backup(draft):
     # and therefore it's the earliest text the translator could have worked from
     # we want to build a list of additions made since that point
     datastore_client = DatastoreClientProxy.get_instance()
-    debug(f"get_pre_translation_backup: draft id is {draft.key.id}")
+    log.debug("get_pre_translation_backup: draft id is %s", draft.key.id)
+    if draft.get("ok_to_tx_backup_id"):
+        # update_hebrew_draft records which backup that was
+        return datastore_client.get(datastore_client.key("draft_backup", draft["ok_to_tx_backup_id"]))
+
+    # drafts from before we recorded it
     backup_query = datastore_client.query(kind="draft_backup")
-    backup_query.order = ["-backup_timestamp"]
-    backups = backup_query.fetch()
-    candidate = None
-    for backup in backups:
-        if backup["draft_id"] != draft.key.id:
-            continue
-        if not backup['ok_to_translate']:
-            # we've gone too far - want the backup that's 1 younger than this
-            return candidate
-        candidate = backup
-    return candidate
+    backup_query.add_filter(filter=PropertyFilter("draft_id", "=", draft.key.id))
+    backup_query.add_filter(filter=PropertyFilter("ok_to_translate", "=", True))
+    backup_query.order = ["backup_timestamp"]
+    for backup in backup_query.fetch(limit=1):
+        return backup
+    return None
 
 
-def get_translated_additions_since_ok_to_tx(current_hebrew_text, heb_text_used_for_translation, target_lang="en"):
+def get_translated_additions_since_ok_to_tx(current_hebrew_text, heb_text_used_for_translation, target_lang="en",
+                                           heb_draft_id=None, translation_draft_id=None):
 
-    debug(f"""get_translated_additions_since_ok_to_tx: heb is:\n{current_hebrew_text}\n\n
-                backup is:\n{heb_text_used_for_translation}\n\n""")
-    parsed_heb_draft = parse_for_comparison(current_hebrew_text.split('\n'))
+    log.debug("get_translated_additions_since_ok_to_tx: heb is:\n%s\n\nbackup is:\n%s\n\n",
+              current_hebrew_text, heb_text_used_for_translation)
+    parsed_heb_draft = get_parsed_edition(current_hebrew_text, heb_draft_id).sections
 
-    parsed_backup = parse_for_comparison(heb_text_used_for_translation.split('\n'))
-    debug(f"""get_translated_additions_since_ok_to_translate: heb is:\n{parsed_heb_draft}\n\n
-                backup is:\n{parsed_backup}\n\n""")
+    parsed_backup = get_parsed_edition(heb_text_used_for_translation, translation_draft_id).sections
+    log.debug("get_translated_additions_since_ok_to_translate: heb is:\n%s\n\nbackup is:\n%s\n\n",
+              parsed_heb_draft, parsed_backup)
     additions_by_section = get_substantial_additions(parsed_heb_draft, parsed_backup)
-    debug(f"there were {len(additions_by_section)} sections with additions")
+    log.debug("there were %s sections with additions", len(additions_by_section))
     translated_additions_by_section = defaultdict(list)
 
+    # usually these were already translated in the background when the Hebrew was saved
+    all_additions = [addition for section, additions in additions_by_section.items()
+                     if section in sections['keys_from_Hebrew'] for addition in additions]
+    translations = translate_bullets(all_additions, target_lang) if all_additions else {}
+
     for section_with_addition in additions_by_section:
         # print(f"Additions to section {section_with_addition}:\n{additions_by_section[section_with_addition]}")
         try:
             translated_section_name = sections[target_lang][sections['keys_from_Hebrew'][section_with_addition]]
 
             for addition in additions_by_section[section_with_addition]:
-                translated = translate_text(addition, target_language_code=target_lang)
-                translated_additions_by_section[translated_section_name].append(translated)
+                translated_additions_by_section[translated_section_name].append(translations[addition])
         except KeyError as ke:
-            debug(f"ERROR from get_translated_additions_since_ok_to_translate(): KeyError: {ke}")
+            log.debug("ERROR from get_translated_additions_since_ok_to_translate(): KeyError: %s", ke)
 
-    debug(f"there are now {len(translated_additions_by_section)} translations of those")
+    log.debug("there are now %s translations of those", len(translated_additions_by_section))
     return additions_by_section, translated_additions_by_section
 
 
+def precompute_translated_additions(heb_draft_id):
+    # run (via deferred) when the Hebrew is saved after ok-to-translate: translate whatever bullets each of its
+    # translation drafts will be shown as additions, so /getUntranslatedAdditions finds them ready
+    datastore_client = DatastoreClientProxy.get_instance()
+    heb_draft = datastore_client.get(datastore_client.key("draft", int(heb_draft_id)))
+    if heb_draft is None:
+        return
+    parsed_heb_draft = get_parsed_edition(heb_draft["hebrew_text"], heb_draft.key.id).sections
+
+    query = datastore_client.query(kind="draft")
+    query.add_filter(filter=PropertyFilter("heb_draft_id", "=", str(heb_draft_id)))
+    bases_by_lang = defaultdict(set)
+    for translation_draft in query.fetch():
+        # Youth is Hebrew, there's nothing to translate
+        if translation_draft["translation_lang"] not in ["YY", "he", "--"]:
+            bases_by_lang[translation_draft["translation_lang"]].add(translation_draft["hebrew_text"])
+
+    for lang, bases in bases_by_lang.items():
+        additions = set()
+        for base in bases:
+            parsed_base = get_parsed_edition(base).sections
+            for section, section_additions in get_substantial_additions(parsed_heb_draft, parsed_base).items():
+                if section in sections['keys_from_Hebrew']:
+                    additions.update(section_additions)
+        if additions:
+            translate_bullets(list(additions), lang)
+
+
 # if __name__ == "__main__":
 
 #     datastore_client = DatastoreClientProxy.get_instance()
@@ -139,13 +166,13 @@ def get_translated_additions_since_ok_to_tx(current_hebrew_text, heb_text_used_f
 
 #     drafts = draft_query.fetch()
 #     for draft in drafts:
-#         debug(f"Checking: {draft['translation_lang']}")
+#         log.debug("Checking: %s", draft['translation_lang'])
 #         if draft['translation_lang'] == '--' and draft['ok_to_translate']:
 #             break
 
-#     debug(f"Processing a Hebrew draft with ID {draft.key.id} from {draft['timestamp']}")
+#     log.debug("Processing a Hebrew draft with ID %s from %s", draft.key.id, draft['timestamp'])
 #     heb_additions_by_section, translated_additions_by_section = get_translated_additions_since_ok_to_tx(draft, "en")
-#     debug("Here are all the added bullets:")
+#     log.debug("Here are all the added bullets:")
 #     for section in heb_additions_by_section:
 #         debug(section + ":")
 #         for addition in heb_additions_by_section[section]:
@@ -154,4 +181,4 @@ def get_translated_additions_since_ok_to_tx(current_hebrew_text, heb_text_used_f
 #         debug(translated_section_name + ":")
 #         for addition in translated_additions_by_section[translated_section_name]:
 #             debug(addition)
-#         debug("\n")
+#         log.debug("\n")
@@ -22,85 +22,34 @@
 #
 #################################################################################
 
-from bs4 import BeautifulSoup
-from google.cloud import datastore, storage
+from google.appengine.api import taskqueue
+from google.appengine.ext import deferred
+from google.cloud import datastore
 from google.cloud.datastore.query import PropertyFilter
-import requests
 
-from common import ARCHIVE_BASE, compare_draft_state_lists, DateInfo, debug, DatastoreClientProxy, DraftStates
-from common import JERUSALEM_TZ
+from archive_pages import PARTS_OF_DAY, request_archive_publish
+from async_jobs import enqueue_speculative_translations
+from common import compare_draft_state_lists, DateInfo, DatastoreClientProxy, draft_maturity_rank, DraftStates
+from common import get_logger, JERUSALEM_TZ
+from diff_draft_versions import precompute_translated_additions
 from language_mappings import editions
+from parsed_edition import get_parsed_edition
 
 import cachetools.func
 from collections import defaultdict
 from datetime import datetime
-import re
+import hashlib
+import time
 from zoneinfo import ZoneInfo
 
 DRAFT_TTL = 60 * 60 * 24
-
-storage_client = storage.Client()
-archive_bucket = storage_client.bucket("tamtzit-archive")
+# autosaves come every few seconds, the bullet translations for them are only worked out once per window
+PRECOMPUTE_ADDITIONS_DELAY_SECS = 30
+# drafts per transaction in backfill_derived_draft_fields(), well under Datastore's limit of 500
+BACKFILL_BATCH_SIZE = 100
 
 datastore_client = DatastoreClientProxy.get_instance()
-
-
-def make_new_archive_entry(soup, next_entry_tag, draft, anchor, lang_code):
-    new_entry = soup.new_tag("div")
-    new_entry.attrs['id'] = anchor
-    next_entry_tag.insert_after("\n\n", new_entry)
-
-    table_tag = soup.new_tag("table")
-    table_tag.attrs['border'] = '4'
-    table_tag.attrs['width'] = '750px'
-    table_tag.attrs['cellpadding'] = '20px'
-    new_entry.append(table_tag)
-
-    tr_tag = soup.new_tag("tr")
-    table_tag.append(tr_tag)
-
-    td_tag = soup.new_tag("td")
-    td_tag.attrs['id'] = anchor + "-td"
-    if lang_code == 'he':
-        td_tag.attrs['dir'] = 'rtl'
-        td_tag.attrs['align'] = 'right'
-    tr_tag.append(td_tag)
-
-    script_tag = soup.new_tag("script")
-    script_tag.string = f"""document.getElementById('{anchor}-td').innerHTML = 
-                makeWhatsappPreview(`{draft['hebrew_text'] if lang_code == 'he' else draft['translation_text']}`);"""
-    td_tag.append(script_tag)
-
-    other_langs_div = soup.new_tag("div")
-    other_langs_div.attrs['id'] = anchor + "-other-langs"
-    other_langs_div.attrs['style'] = "padding-top: 10px; font-weight: bold;"
-    other_langs_div.string = "Other Languages:"
-    new_entry.append("\n")
-    new_entry.append(other_langs_div)
-
-    section_divider_tag = soup.new_tag("hr")
-    new_entry.insert_after(section_divider_tag)
-
-    if lang_code != 'fr':
-        link_to_fr = soup.new_tag("a")
-        link_to_fr.attrs['href'] = f'{ARCHIVE_BASE}archive-fr.html#{anchor}'
-        link_to_fr.attrs['style'] = "padding-left: 20px;"
-        link_to_fr.string = 'French'
-        other_langs_div.append(link_to_fr)
-
-    if lang_code != 'en':
-        link_to_en = soup.new_tag("a")
-        link_to_en.attrs['href'] = f'{ARCHIVE_BASE}archive-en.html#{anchor}'
-        link_to_en.attrs['style'] = "padding-left: 20px;"
-        link_to_en.string = 'English'
-        other_langs_div.append(link_to_en)
-
-    if lang_code != 'he':
-        link_to_he = soup.new_tag("a")
-        link_to_he.attrs['href'] = f'{ARCHIVE_BASE}archive-he.html#{anchor}'
-        link_to_he.attrs['style'] = "padding-left: 20px;"
-        link_to_he.string = 'Hebrew'
-        other_langs_div.append(link_to_he)
+log = get_logger(__name__)
 
 
 def get_latest_day_worth_of_editions():
@@ -109,32 +58,59 @@ def get_latest_day_worth_of_editions():
     and 
     start_daily_summary() which is a route method, called by the hebrew.html page on submission
     """
-    latest_drafts, _ = fetch_drafts()
-    todays_editions = defaultdict(dict)
-    for draft in latest_drafts:
-
-        # if the last_edit was yesterday, break out of the loop
-        draft_last_change_ts = draft['last_edit'].astimezone(JERUSALEM_TZ)
-        if draft_last_change_ts.date() != datetime.now(tz=ZoneInfo('Asia/Jerusalem')).date():
-            break
+    # just the drafts edited today, most mature first (and of those, newest first) - so the first draft of each
+    # language and edition is the one we want. See set_derived_draft_fields() for the properties used
+    # (drafts last saved before those were stored are given them by backfill_derived_draft_fields())
+    query = datastore_client.query(kind="draft")
+    query.add_filter(filter=PropertyFilter("edition_date", "=", datetime.now(tz=JERUSALEM_TZ).strftime('%Y-%m-%d')))
+    query.order = ["-maturity_rank", "-timestamp"]
 
+    todays_editions = defaultdict(dict)
+    for draft in query.fetch():
         draft_lang = 'he' if draft['translation_lang'] == '--' else draft['translation_lang']
-        draft_time_of_day = get_edition_name_from_text(draft)
-        debug(f"GLDWOE: Checking latest {draft_lang} draft ({draft_time_of_day}) - is this most mature for this lang at this time of day? {draft['states']}")
+        draft_time_of_day = draft['edition_name']
         if draft_time_of_day not in todays_editions[draft_lang]:
             todays_editions[draft_lang][draft_time_of_day] = draft
-            debug(f"GLDWOE: added {draft_time_of_day} to yesterdays_Editions for lang {draft_lang}")            
-        else:
-            draft_maturity = compare_draft_state_lists(draft, todays_editions[draft_lang][draft_time_of_day])
-            if draft_maturity == -1:
-                todays_editions[draft_lang][draft_time_of_day] = draft
-                debug(f"GLDWOE: Yes, this is the most mature draft found so far.")
-            else:
-                debug("GLDWOE: No, this edition is not newer.")
+            log.debug("GLDWOE: the most mature %s draft for %s is %s, maturity %s", draft_lang, draft_time_of_day, draft.key.id, draft['maturity_rank'])
                 
     return todays_editions
 
 
+def set_derived_draft_fields(draft):
+    # stored on the draft (indexed) whenever it's saved or its states change, so that readers don't have to work
+    # them out again, and queries can filter and sort on them:
+    #   edition_name - in English, as from get_edition_name_from_text()
+    #   edition_index - its place in the day's editions (morning is 0), None if we don't know which edition it is
+    #   edition_date - the (Jerusalem) date it was last edited, YYYY-MM-DD
+    #   maturity_rank - how far it has got towards publishing, see draft_maturity_rank()
+    edition_name = get_edition_name_from_text(draft)
+    draft.update({"edition_name": edition_name,
+                  "edition_index": PARTS_OF_DAY.index(edition_name) if edition_name in PARTS_OF_DAY else None,
+                  "edition_date": draft['last_edit'].astimezone(JERUSALEM_TZ).strftime('%Y-%m-%d'),
+                  "maturity_rank": draft_maturity_rank(draft["states"])})
+
+
+def backfill_derived_draft_fields():
+    # one-time, run (via deferred) from /backfill-draft-fields: give the drafts saved before we stored
+    # set_derived_draft_fields()'s properties those properties, so get_latest_day_worth_of_editions() finds them.
+    # Each batch is re-read in a transaction, so an editor's save in the meantime isn't overwritten
+    query = datastore_client.query(kind="draft")
+    query.keys_only()
+    keys = [entity.key for entity in query.fetch()]
+    backfilled = 0
+    for batch_start in range(0, len(keys), BACKFILL_BATCH_SIZE):
+        with datastore_client.transaction():
+            batch = datastore_client.get_multi(keys[batch_start:batch_start + BACKFILL_BATCH_SIZE])
+            # (there's nothing to derive them from for a draft without text or a last edit)
+            drafts = [draft for draft in batch if "edition_date" not in draft and
+                      draft.get("hebrew_text") is not None and draft.get("last_edit")]
+            for draft in drafts:
+                set_derived_draft_fields(draft)
+            datastore_client.put_multi(drafts)
+        backfilled += len(drafts)
+    log.info("backfill_derived_draft_fields: updated %s of %s drafts", backfilled, len(keys))
+
+
 def get_more_mature_draft(draft1, draft2):
     draft_maturity = compare_draft_state_lists(draft1['states'], draft2['states'])
     if draft_maturity == 1:
@@ -145,34 +121,31 @@ def get_more_mature_draft(draft1, draft2):
 def get_edition_name_from_text(edition, as_english_always=True):
     lang = edition['translation_lang']
     text = edition['hebrew_text']
-    debug(f"g_e_n_f_t: lang={lang}")
-    m = re.search("^\*?מהדורת ([א-ת]+),", text, re.MULTILINE)   # noqa - the pattern works
-    # The pattern WON'T match on the daily summary or motzei Shabbat!
-    if m:
-        debug(f"g_e_n_f_t found {m.group(1)}, localizing...")
-        edition_index = editions['he'].index(m.group(1))
+    log.debug("g_e_n_f_t: lang=%s", lang)
+    edition_name = get_parsed_edition(text, edition.key.id).edition_name
+    # The pattern WON'T match on the daily summary or motzei Shabbat! It does match other words, e.g. an
+    # emergency edition or another spelling - those are UNKNOWN, like a draft with no edition name at all
+    if edition_name and edition_name[0] == "regular" and edition_name[1] in editions['he']:
+        log.debug("g_e_n_f_t found %s, localizing...", edition_name[1])
+        edition_index = editions['he'].index(edition_name[1])
         if as_english_always:
             return editions['en'][edition_index]
         if lang == '--':
-            return m.group(1)
+            return edition_name[1]
         return editions[lang][edition_index]
-    else:
-        m = re.search("^\*?מהדורה יומית", text, re.MULTILINE)   # noqa
-        if m:
-            debug("g_e_n_f_t found daily summary edition, localizing...")
-            if as_english_always:
-                return "Heb Daily Summary"
-            else:
-                return "מהדורה יומית"
+    elif edition_name and edition_name[0] == "daily_summary":
+        log.debug("g_e_n_f_t found daily summary edition, localizing...")
+        if as_english_always:
+            return "Heb Daily Summary"
+        else:
+            return "מהדורה יומית"
+    elif edition_name and edition_name[0] == "motzei_shabbat":
+        log.debug("g_e_n_f_t found motzei Shabbat edition, localizing...")
+        if as_english_always:
+            return editions['en'][1]
         else:
-            m = re.search("^\*?מהדורת מוצאי שבת, ", text, re.MULTILINE)   # noqa
-            if m:
-                debug("g_e_n_f_t found motzei Shabbat edition, localizing...")
-                if as_english_always:
-                    return editions['en'][1]
-                else:
-                    return editions['he' if lang == '--' else lang][1]
-    debug(f"g_e_n_f_t: lang={lang}, can't find edition name, returning UNKNOWN, text was: \n\n{text}\n\n")
+            return editions['he' if lang == '--' else lang][1]
+    log.debug("g_e_n_f_t: lang=%s, can't find edition name, returning UNKNOWN, text was: \n\n%s\n\n", lang, text)
     return "UNKNOWN"
 
 
@@ -197,7 +170,7 @@ def fetch_drafts(query_order="-timestamp"):
             query2.add_filter(filter=PropertyFilter("draft_id", "=", draft.key.id))
             draft_backups = query2.fetch()
             for dbkup in draft_backups:
-                debug("found a backup, deleting it")
+                log.debug("found a backup, deleting it")
                 datastore_client.delete(dbkup.key)
         else:
             draft_last_change_ts = draft['last_edit']
@@ -214,7 +187,7 @@ def create_draft(heb_text, user_info, draft_timestamp, translation_text='', tran
     and return the new key and timestamp"""
 
     if len(heb_text) > 0 and heb_draft_id is None:
-        debug("create_draft() ERROR: received heb_text but no heb_draft_id")
+        log.debug("create_draft() ERROR: received heb_text but no heb_draft_id")
         raise ValueError("No draft ID though text is present")
 
     key = datastore_client.key("draft")
@@ -226,6 +199,7 @@ def create_draft(heb_text, user_info, draft_timestamp, translation_text='', tran
                    "is_finished": False, "ok_to_translate": False, "created_by": user_info.key.id,
                    "states": [{"state": DraftStates.WRITING.name, "at": draft_timestamp.strftime('%Y%m%d-%H%M%S'),
                               "by": user_info["name"], "by_heb": user_info["name_hebrew"]}]}) 
+    set_derived_draft_fields(entity)
     datastore_client.put(entity)
     entity = datastore_client.get(entity.key)
     return entity.key
@@ -248,7 +222,7 @@ def create_draft_history(draft):
 
 
 def store_draft_backup(draft, force_backup=False):
-    debug("checking whether to save a draft backup...")
+    log.debug("checking whether to save a draft backup...")
     prev_backup_time = 0
     query2 = datastore_client.query(kind="draft_backup")
     query2.order = ["-backup_timestamp"]
@@ -256,21 +230,21 @@ def store_draft_backup(draft, force_backup=False):
     draft_backups = query2.fetch()
     for dbkup in draft_backups:
         if dbkup["draft_id"] != draft.key.id:
-            debug("Found a backup but not for this draft")
+            log.debug("Found a backup but not for this draft")
             continue
         else:
-            debug(f"found a relevant backup which was created on {dbkup['backup_timestamp']}")
+            log.debug("found a relevant backup which was created on %s", dbkup['backup_timestamp'])
             prev_backup_time = dbkup['backup_timestamp']
             break
     if prev_backup_time == 0:
-        debug("No prev backup found")
+        log.debug("No prev backup found")
     else:
-        debug(f'''draft last edit is {draft["last_edit"]} so the backup is 
-                {draft["last_edit"] - prev_backup_time} 
-                which is {(draft["last_edit"] - prev_backup_time).seconds} seconds old''')
+        log.debug("draft last edit is %s so the backup is %s which is %s seconds old", draft["last_edit"],
+                  draft["last_edit"] - prev_backup_time, (draft["last_edit"] - prev_backup_time).seconds)
     if force_backup or prev_backup_time == 0 or (draft["last_edit"] - prev_backup_time).seconds > 90:
-        debug("creating a draft backup")
-        create_draft_history(draft)
+        log.debug("creating a draft backup")
+        return create_draft_history(draft)
+    return None
 
 
 def update_translation_draft(draft_key, translated_text, user_info, is_finished=False):
@@ -290,6 +264,7 @@ def update_translation_draft(draft_key, translated_text, user_info, is_finished=
         prev_states.append({"state": DraftStates.PUBLISH_READY.name, "at": edit_timestamp.strftime('%Y%m%d-%H%M%S'),
                             "by": user_info["name"], "by_heb": user_info["name_hebrew"]})
 
+    set_derived_draft_fields(draft)
     datastore_client.put(draft)
 
     # also store history in case of dramatic failure
@@ -301,6 +276,8 @@ def update_translation_draft(draft_key, translated_text, user_info, is_finished=
 
 def update_hebrew_draft(draft_key, hebrew_text, user_info, is_finished=False, ok_to_translate=False):
     draft = datastore_client.get(draft_key)
+    newly_ok_to_translate = ok_to_translate and not draft.get("ok_to_translate")
+    text_before_this_save = draft["hebrew_text"]
     draft.update({"hebrew_text": hebrew_text})
     draft.update({"is_finished": is_finished})
     if ok_to_translate:  
@@ -321,12 +298,12 @@ def update_hebrew_draft(draft_key, hebrew_text, user_info, is_finished=False, ok
         if DraftStates.EDIT_ONGOING.name not in [states_entry["state"] for states_entry in prev_states]:
             prev_states.append({"state": DraftStates.EDIT_ONGOING.name, "at": edit_timestamp.strftime('%Y%m%d-%H%M%S'),
                                 "by": user_info["name"], "by_heb": user_info["name_hebrew"]})
+            # remember how the end of the edition looked before any editing, see do_edits_reach_last_two_sections()
+            draft.update({"pre_edit_last_sections_hash": last_two_sections_hash(text_before_this_save, draft.key.id)})
 
-        # has the bottom 20% of text changed from what it was originally?
-        bottom_20_percent_changed = do_edits_reach_last_two_sections(draft)
-
-        if (bottom_20_percent_changed and
-                DraftStates.EDIT_NEAR_DONE.name not in [states_entry["state"] for states_entry in prev_states]):
+        # has the bottom 20% of text changed from what it was originally? (no need to check once we know it has)
+        if (DraftStates.EDIT_NEAR_DONE.name not in [states_entry["state"] for states_entry in prev_states] and
+                do_edits_reach_last_two_sections(draft)):
             prev_states.append({"state": DraftStates.EDIT_NEAR_DONE.name,
                                 "at": edit_timestamp.strftime('%Y%m%d-%H%M%S'),
                                 "by": user_info["name"], "by_heb": user_info["name_hebrew"]})
@@ -335,16 +312,39 @@ def update_hebrew_draft(draft_key, hebrew_text, user_info, is_finished=False, ok
         prev_states.append({"state": DraftStates.PUBLISH_READY.name, "at": edit_timestamp.strftime('%Y%m%d-%H%M%S'),
                             "by": user_info["name"], "by_heb": user_info["name_hebrew"]})
 
+    set_derived_draft_fields(draft)
     datastore_client.put(draft)
 
     # also store history in case of dramatic failure
     # and for reasons related to applying deltas in translation, we need to force save this as a backup
-    store_draft_backup(draft, force_backup=ok_to_translate)
+    backup_key = store_draft_backup(draft, force_backup=ok_to_translate)
+
+    if newly_ok_to_translate:
+        # that backup is the text as it was when translators could first start, see get_pre_translation_backup()
+        draft.update({"ok_to_tx_backup_id": backup_key.id})
+        datastore_client.put(draft)
+        # get the machine translations going now, so they're ready when translators arrive
+        deferred.defer(enqueue_speculative_translations, draft.key.id)
+    elif draft["ok_to_translate"]:
+        # translators may already be working, translate the bullets they'll see as additions in the background
+        request_precompute_translated_additions(draft.key.id)
 
     if is_finished:
         update_archive(draft)
 
 
+def request_precompute_translated_additions(heb_draft_id):
+    # like request_archive_publish(): one task per draft and PRECOMPUTE_ADDITIONS_DELAY_SECS window, which waits
+    # out the window and then works from whatever the draft's text is by then
+    window = int(time.time() // PRECOMPUTE_ADDITIONS_DELAY_SECS)
+    task_name = f"precompute-additions-{heb_draft_id}-{window}"
+    try:
+        deferred.defer(precompute_translated_additions, heb_draft_id,
+                       _name=task_name, _countdown=PRECOMPUTE_ADDITIONS_DELAY_SECS)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        log.debug("request_precompute_translated_additions: %s already scheduled", task_name)
+
+
 @cachetools.func.ttl_cache(ttl=600)
 def cache_heb_draft_text_before_edits(draft_id):
     query2 = datastore_client.query(kind="draft_backup")
@@ -360,78 +360,47 @@ def cache_heb_draft_text_before_edits(draft_id):
     return None
 
 
+def last_two_sections_hash(text, draft_id=None):
+    # None if there's no text to hash, e.g. a draft or backup saved without any
+    if text is None:
+        return None
+    return hashlib.sha1(get_parsed_edition(text, draft_id).last_two_sections.encode()).hexdigest()
+
+
 def do_edits_reach_last_two_sections(draft):
     # be careful - we can't actually check against the 20% end of the string
     # because the changes prior to it change where the last 20% starts!
     # so instead we have to find the 2nd to last section heading in the original text,
     # find that same heading in the new text, and see if there
     # are changes from there onward. If that heading isn't found in the new text, the answer is yes.
-    # first challenge - get SHIRA'S original version of the Hebrew text currently being changed
-    current_text = draft["hebrew_text"]
-    last_backup_before_editing = cache_heb_draft_text_before_edits(draft.key.id)
-    if not last_backup_before_editing:
-        return False
-    text_at_ready_to_edit = last_backup_before_editing["hebrew_text"]
-
-    try:
-        orig_last_heading = text_at_ready_to_edit.rfind("📌")
-        orig_second_last_heading = text_at_ready_to_edit.rfind("📌", 0, orig_last_heading)
-        orig_footer_start_pos = text_at_ready_to_edit.find("•   •   •", orig_last_heading)
-        orig_last_chunk = text_at_ready_to_edit[orig_second_last_heading:orig_footer_start_pos]
-        curr_last_heading = current_text.rfind("📌")
-        curr_second_last_heading = current_text.rfind("📌", 0, curr_last_heading)
-        curr_footer_start_pos = current_text.find("•   •   •", curr_last_heading)
-        curr_last_chunk = current_text[curr_second_last_heading:curr_footer_start_pos]
-        # debug("Checking whether edits have reached the last section. Originally it was:")
-        # debug(orig_last_chunk)
-        # debug("Now the last section is:")
-        # debug(curr_last_chunk)
-        return curr_last_chunk != orig_last_chunk
-    except:
+    # The original - SHIRA'S version of the Hebrew text, before editing started - is kept on the draft as a
+    # hash of its last two sections, made by update_hebrew_draft when editing starts.
+    if "pre_edit_last_sections_hash" not in draft:
+        # editing started before we kept the hash, so get the original from the backups, once;
+        # the caller saves the draft, hash and all. If there's no backup to get it from, the hash is saved
+        # as None so we don't keep looking.
+        last_backup_before_editing = cache_heb_draft_text_before_edits(draft.key.id)
+        draft.update({"pre_edit_last_sections_hash":
+                      last_two_sections_hash(last_backup_before_editing.get("hebrew_text"), draft.key.id)
+                      if last_backup_before_editing else None})
+
+    current_hash = last_two_sections_hash(draft.get("hebrew_text"), draft.key.id)
+    if current_hash is None or draft["pre_edit_last_sections_hash"] is None:
+        # nothing to compare - no pre-edit text was found, or there's no text now
         return False
+    return current_hash != draft["pre_edit_last_sections_hash"]
 
-############################################
-# Notes on use of GCP Cloud Storage (GCS)
-#   
-# For downloading a file:
-# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_download_file.py
-# 
-# For uploading a file:
-# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_upload_file.py
-# or to upload from memory:
-# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_upload_from_memory.py
-# or from a stream:
-# https://github.com/googleapis/python-storage/blob/main/samples/snippets/storage_upload_from_stream.py
-# 
 def update_archive(draft):
-    debug("updating archive...")
+    log.debug("updating archive...")
     lang_code = 'he' if draft["translation_lang"] == '--' else draft["translation_lang"]
     if lang_code == 'YY':
         return  # we're not archiving those editions as they're just a subset of the regular Hebrew content
     
     date_info = make_date_info(datetime.now(JERUSALEM_TZ), 'en')  # Forced to EN so that we get English anchor names
-    prev_archive = requests.get(f"{ARCHIVE_BASE}archive-{lang_code}.html").text
-
-    soup = BeautifulSoup(prev_archive, "html.parser")
-    next_entry_tag = soup.find(id='next-entry')
-
-    if not next_entry_tag:
-        print(f"ERROR: update_archive can't find the next-entry tag for language {lang_code}, returning.")
-        return
-        
     anchor = draft['timestamp'].astimezone(JERUSALEM_TZ).strftime('%Y-%m-%d') + '-' + date_info.part_of_day
 
-    make_new_archive_entry(soup, next_entry_tag, draft, anchor, lang_code)
-
-    upload_to_cloud_storage(f"archive-{lang_code}.html", str(soup))
-
-
-def upload_to_cloud_storage(file_name, text_content):
-    blob = archive_bucket.blob(file_name)
-    blob.upload_from_string(text_content)
-    blob.content_type = "text/html; charset=utf-8"
-    blob.patch()
-    debug("DONE uploading new archive")
+    # published in the background, so that the editor's save isn't held up
+    request_archive_publish(draft, anchor, lang_code)
 
 
 def make_date_info(dt, lang):
@@ -0,0 +1,137 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+############################################
+# The translation glossary: our preferred translations of titles and terms, the substitutions made before and after
+# machine translation (see text_swaps.py), and the OpenAI prompts which use them.
+#
+# glossary.json, deployed with the code, is the default. A newer version can be published to the DB with
+#   python glossary.py publish glossary.json
+# (bump its "version" first). Every instance - web app and async processor - checks the DB for a newer version every
+# GLOSSARY_CHECK_INTERVAL_SECS, so it takes effect without a deploy or restart. A deployed glossary.json with a higher
+# version than the DB's wins.
+#
+# Whatever is built from the glossary (compiled regexes, prompts) is built once per version, see for_current_glossary.
+
+from datetime import datetime
+import functools
+import json
+import os
+import sys
+
+import cachetools.func
+from google.cloud import datastore
+
+from common import DatastoreClientProxy, get_logger, JERUSALEM_TZ
+
+GLOSSARY_FILE = os.path.join(os.path.dirname(__file__), "glossary.json")
+GLOSSARY_CHECK_INTERVAL_SECS = 60
+
+log = get_logger(__name__)
+
+
+def load_glossary_file(path=GLOSSARY_FILE):
+    with open(path, encoding="utf-8") as glossary_file:
+        return json.load(glossary_file)
+
+
+local_glossary = load_glossary_file()
+db_glossary = None
+# the web app uses the default client; the async processor, which has its own project and credentials, sets its own
+glossary_datastore_client = None
+
+
+def use_datastore_client(datastore_client):
+    global glossary_datastore_client
+    glossary_datastore_client = datastore_client
+
+
+def get_glossary_datastore_client():
+    return glossary_datastore_client or DatastoreClientProxy.get_instance()
+
+
+@cachetools.func.ttl_cache(ttl=GLOSSARY_CHECK_INTERVAL_SECS)   # note that this only works when the method has an input param!
+def get_glossary(name="current"):
+    # whichever is newer, the glossary deployed with the code or the one in the DB
+    global db_glossary
+    try:
+        datastore_client = get_glossary_datastore_client()
+        entity = datastore_client.get(datastore_client.key("glossary", name))
+    except Exception as err:  # noqa - not being able to check for a newer glossary mustn't stop us translating
+        log.warning("get_glossary: unable to check the DB for a newer glossary: %s", err)
+        # carry on with the newest one we've seen
+        if db_glossary and db_glossary["version"] > local_glossary["version"]:
+            return db_glossary
+        return local_glossary
+    if entity is None or entity["version"] <= local_glossary["version"]:
+        return local_glossary
+    if db_glossary is None or db_glossary["version"] != entity["version"]:
+        log.debug("get_glossary: loading glossary version %s from the DB", entity['version'])
+        db_glossary = json.loads(entity["content"])
+    return db_glossary
+
+
+def for_current_glossary(build_from_glossary):
+    # Decorator for a function which builds something from a glossary. The decorated function takes no arguments and
+    # returns what was built from the current glossary, calling build_from_glossary again only when its version changes.
+    built = {}
+
+    @functools.wraps(build_from_glossary)
+    def get_built():
+        nonlocal built
+        glossary = get_glossary()
+        latest = built
+        if glossary["version"] not in latest:
+            log.debug("%s: building from glossary version %s", build_from_glossary.__name__, glossary['version'])
+            latest = {glossary["version"]: build_from_glossary(glossary)}
+            built = latest
+        return latest[glossary["version"]]
+    return get_built
+
+
+def publish_glossary_file(path, name="current"):
+    glossary = load_glossary_file(path)
+    # make sure it can be compiled before every instance tries to use it
+    from text_swaps import GlossarySwaps
+    GlossarySwaps(glossary)
+
+    datastore_client = get_glossary_datastore_client()
+    key = datastore_client.key("glossary", name)
+    published = datastore_client.get(key)
+    if published and glossary["version"] <= published["version"]:
+        log.warning("Version %s is not newer than the published version %s", glossary['version'], published['version'])
+        return False
+    entity = datastore.Entity(key, exclude_from_indexes=("content",))
+    entity.update({"version": glossary["version"], "content": json.dumps(glossary, ensure_ascii=False),
+                   "published_at": datetime.now(tz=JERUSALEM_TZ)})
+    datastore_client.put(entity)
+    log.info("Published glossary version %s from %s", glossary['version'], path)
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "publish":
+        print("usage: python glossary.py publish glossary.json")
+        sys.exit(1)
+    sys.exit(0 if publish_glossary_file(sys.argv[2]) else 1)
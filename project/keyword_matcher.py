@@ -0,0 +1,57 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+
+############################################
+# Finding which kinds of section keywords (see language_mappings.keywords) appear in a line, in one pass
+#
+# Each kind has one or more keywords, and a kind "appears" if any of its keywords is a substring of the line -
+# exactly what checking them one by one with "in" would say, but with a single regex search per line.
+# The regex is a lookahead, so it finds a keyword starting at every position, even inside or overlapping
+# another one. Where two keywords start at the same position the longer one wins, which is why a keyword
+# also counts as every (shorter) keyword it starts with.
+
+from collections import defaultdict
+import re
+
+
+class KeywordMatcher:
+
+    def __init__(self, keywords_by_kind) -> None:
+        kinds_by_keyword = defaultdict(set)
+        for kind, kind_keywords in keywords_by_kind.items():
+            for keyword in ([kind_keywords] if type(kind_keywords) is str else kind_keywords):
+                kinds_by_keyword[keyword].add(kind)
+
+        self.kinds_by_keyword = {keyword: frozenset().union(*(kinds for other, kinds in kinds_by_keyword.items()
+                                                               if keyword.startswith(other)))
+                                 for keyword in kinds_by_keyword}
+        alternatives = sorted(kinds_by_keyword, key=len, reverse=True)
+        self.pattern = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in alternatives) + "))")
+
+    def kinds_in(self, line):
+        found = set()
+        for match in self.pattern.finditer(line):
+            found |= self.kinds_by_keyword[match.group(1)]
+        return found
@@ -0,0 +1,168 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+############################################
+# One parse of an edition's (Hebrew) text, shared by everything that needs to pick it apart
+#
+# The same draft text gets looked at many times per request, and by many requests: for the translators'
+# delta view, for stripping the header and footer before translating, for the edition name on the
+# dashboard, for checking how far the editing has got... get_parsed_edition() parses a given version
+# of the text once, and keeps the result in an LRU cache keyed by draft ID and a hash of the text,
+# so any edit makes a new entry and stale ones just fall out.
+#
+# A ParsedEdition is shared between requests (and threads), so treat everything in it as read-only.
+
+from collections import defaultdict
+from functools import cached_property
+import hashlib
+import re
+import threading
+
+import cachetools
+
+from common import get_logger
+from language_mappings import sections, translated_section_names
+
+log = get_logger(__name__)
+
+PARSED_EDITION_CACHE_SIZE = 64
+
+section_header_pat = re.compile(r"[📌>] \*?_?([^_:*]+):_?\*?")
+regular_edition_pat = re.compile(r"^\*?מהדורת ([א-ת]+),", re.MULTILINE)
+daily_summary_pat = re.compile(r"^\*?מהדורה יומית", re.MULTILINE)
+motzei_shabbat_pat = re.compile(r"^\*?מהדורת מוצאי שבת, ", re.MULTILINE)
+comparison_prefix_pat = re.compile("^[•📌>-]")
+
+
+def parse_for_comparison(text):
+    # text is a list of lines; returns {section: [bullets]}, where a bullet is all the lines of one entry
+    result = defaultdict(list)
+    section = None
+    current_entry = None
+    for line in text:
+        line = line.strip()
+        if len(line.replace("•", "").strip()) == 0:
+            # print(f"skipping a blank line: {line}")
+            current_entry = None
+            continue
+        # two consecutive lines not separated by a blank line will be considered the same entry
+        if not comparison_prefix_pat.match(line):  # it doesn't start with any prefix
+            if current_entry:
+                result[section][-1] = result[section][-1] + "\n" + line
+                # print("Appending this line to the previous one")
+                # else:
+                # print(f"skipping a no-prefix non-blank line: {line}")
+        elif not (line.startswith("•") or line.startswith("-")):
+            section = line  # this should always get replaced, but just in case...
+            for heb_section in sections['keys_from_Hebrew']:
+                if heb_section in line:
+                    section = heb_section
+                    break
+        else:
+            current_entry = line
+            result[section].append(current_entry)
+    return result
+
+
+class ParsedEdition:
+
+    def __init__(self, text) -> None:
+        self.text = text
+        self.lines = text.split("\n")
+
+        # the header is everything before the first pin, the footer starts at the three dots after it
+        self.header = []
+        self.body = []
+        self.footer = []
+        part = self.header
+        for line in self.lines:
+            if part is self.header and "📌" in line:
+                part = self.body
+            elif part is self.body and ("• • •" in line or "•   •   •" in line):
+                part = self.footer
+            part.append(line)
+
+        self._stripped = {}
+
+    @cached_property
+    def sections(self):
+        # {section: [bullets]}, for the delta view. Like the other properties, only worked out if it's needed.
+        # Don't look up sections which might not be there, that would add them to the (shared) defaultdict -
+        # check with "in" first.
+        return parse_for_comparison(self.lines)
+
+    @cached_property
+    def edition_name(self):
+        # the edition as written in the Hebrew text, one of:
+        # ("regular", its Hebrew name), ("daily_summary", None), ("motzei_shabbat", None), or None if not found
+        m = regular_edition_pat.search(self.text)
+        if m:
+            return "regular", m.group(1)
+        # the pattern above WON'T match on the daily summary or motzei Shabbat!
+        if daily_summary_pat.search(self.text):
+            return "daily_summary", None
+        if motzei_shabbat_pat.search(self.text):
+            return "motzei_shabbat", None
+        return None
+
+    @cached_property
+    def last_two_sections(self):
+        # from the 2nd to last section heading up to the footer
+        text = self.text
+        last_heading = text.rfind("📌")
+        second_last_heading = text.rfind("📌", 0, last_heading)
+        footer_start_pos = text.find("•   •   •", last_heading)
+        return text[second_last_heading:footer_start_pos]
+
+    def stripped(self, target_language_code):
+        # the body with Hebrew section headings replaced by those of the target language - what gets translated
+        if target_language_code not in self._stripped:
+            self._stripped[target_language_code] = self._strip_header_and_footer(target_language_code)
+        return self._stripped[target_language_code]
+
+    def _strip_header_and_footer(self, target_language_code):
+        log.debug("translated section names is %s", translated_section_names[target_language_code])
+
+        # it's too messy to translate the section headings and then try to figure them out
+        stripped_heb_text = ""
+        for line in self.body:
+            header_match = section_header_pat.match(line)
+            if header_match:
+                log.debug("replacing header\n'%s'\ngroup1 is '%s'", line, header_match.group(1))
+                if header_match.group(1) not in translated_section_names[target_language_code]:
+                    log.debug("We have no mapping for that, so leaving it alone.")
+                else:
+                    line = line.replace(header_match.group(1),
+                                        translated_section_names[target_language_code][header_match.group(1)])
+                log.debug("now it's %s", line)
+
+            stripped_heb_text = stripped_heb_text + line + "\n"
+        return stripped_heb_text
+
+
+@cachetools.cached(cachetools.LRUCache(maxsize=PARSED_EDITION_CACHE_SIZE),
+                   key=lambda text, draft_id=None: (draft_id, hashlib.sha1(text.encode()).digest()),
+                   lock=threading.Lock())
+def get_parsed_edition(text, draft_id=None):
+    return ParsedEdition(text)
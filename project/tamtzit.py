@@ -25,30 +25,38 @@
 import os
 import cachetools.func
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import hmac
 import json
 import re
+import time
 from textwrap import dedent
 from zoneinfo import ZoneInfo
 
 from babel.dates import format_date, format_datetime
-from bs4 import BeautifulSoup, Tag
 from flask import Blueprint, render_template, request, redirect, make_response, url_for
+from google.appengine.api import memcache
+from google.appengine.ext import deferred
 from google.cloud import translate, datastore  # noqa -- Intellij is incorrectly flagging the import
 from google.cloud.datastore.key import Key  # noqa -- Intellij is incorrectly flagging the import
 from google.cloud.datastore.query import PropertyFilter
 from markupsafe import Markup
-import requests
 
+from archive_pages import ARCHIVE_LANGS, republish_day
+from async_jobs import create_async_translation_job, get_reusable_speculative_job
 from auth_utils import confirm_user_has_role, consume_invitation, create_invitation, get_user, require_login
 from auth_utils import require_role, get_user_availability, update_user_availability
 from auth_utils import send_invitation, validate_weekly_birthcert, zero_user
-from common import _set_debug, ARCHIVE_BASE, debug, DatastoreClientProxy, expand_lang_code, JERUSALEM_TZ
+from common import _set_debug, AsyncJobStatus, DatastoreClientProxy, expand_lang_code
+from common import get_logger, JERUSALEM_TZ
 from cookies import Cookies, get_cookie_dict, get_today_noise, make_cookie_from_dict, make_daily_cookie
 from cookies import user_data_from_req
-from draft_utils import create_draft, DraftStates, fetch_drafts, get_latest_day_worth_of_editions, make_date_info
-from draft_utils import make_new_archive_entry, upload_to_cloud_storage, update_hebrew_draft, update_translation_draft
+from draft_utils import backfill_derived_draft_fields, create_draft, DraftStates, fetch_drafts
+from draft_utils import get_latest_day_worth_of_editions, make_date_info
+from draft_utils import set_derived_draft_fields, update_hebrew_draft, update_translation_draft
 from diff_draft_versions import get_translated_additions_since_ok_to_tx
+from keyword_matcher import KeywordMatcher
 from language_mappings import editions, keywords, sections, supported_langs_mapping, translated_section_names
 from template_text_chunks import make_header, make_footer
 from translation_utils import translate_text, strip_header_and_footer
@@ -57,6 +65,7 @@ from weekly_schedule import Schedule
 translation_client = translate.TranslationServiceClient()
 
 datastore_client = DatastoreClientProxy.get_instance()
+log = get_logger(__name__)
 
 ############################################
 # Notes on use of GCP DataStore
@@ -115,27 +124,27 @@ def detect_mobile(param_request, page_name):
 # don't let it be reused
 @tamtzit.route("/auth", methods=['GET', 'POST'])
 def route_authenticate():
-    debug("/auth called with method " + request.method)
+    log.debug("/auth called with method %s", request.method)
 
     if request.method == "GET":
         weekly_cookie = request.cookies.get(Cookies.ONE_WEEK_SESSION)
         if not weekly_cookie:
-            debug("No weekly cookie found")
+            log.debug("No weekly cookie found")
             return render_template("login.html")
 
         # how to create and manage the weekly cookie?
         # one option: just keep a week's worth of entries of the daily noise, check each one of them for inclusion
         # in the weekly cookie and delete any old ones as they're found
         # other option is yet another entity, but it doesn't seem any better, still have to keep it updated...
-        debug("checking validity of weekly cookie which is present")
+        log.debug("checking validity of weekly cookie which is present")
         weekly_session = get_cookie_dict(request, Cookies.ONE_WEEK_SESSION)
         if Cookies.COOKIE_CERT not in weekly_session:
-            debug("Weekly cookie is not valid")
+            log.debug("Weekly cookie is not valid")
             return render_template("login.html")
         bcert = weekly_session[Cookies.COOKIE_CERT]
         if validate_weekly_birthcert(bcert):
-            debug("weekly cookie is valid, refreshing it, setting daily cookie and redirecting to " +
-                  request.args.get('requested'))
+            log.debug("weekly cookie is valid, refreshing it, setting daily cookie and redirecting to %s",
+                      request.args.get('requested'))
             weekly_session[Cookies.COOKIE_CERT] = get_today_noise()
             response = redirect(request.args.get('requested'))
             new_cookie = make_cookie_from_dict(weekly_session)
@@ -147,22 +156,22 @@ def route_authenticate():
             # samesite="Lax", secure=True)
             return response
         else:
-            debug("Weekly cookie is not valid")
+            log.debug("Weekly cookie is not valid")
             return render_template("login.html")
     else:
         # handle login form submission    
         email = request.form.get("email")
-        debug("login attempt from user " + email)
+        log.debug("login attempt from user %s", email)
         user_details = get_user(email.lower())
         if not user_details:
             return render_template("error.html", dont_show_home_link=True,
                                    msg="The email address you provided is unknown. Contact the admin.",
                                    heb_msg="כתובת מייל זו לא מוכרת. צור קשר עם משה.")
 
-        debug("Confirmed - it's a known user. Preparing an invitation link...")
+        log.debug("Confirmed - it's a known user. Preparing an invitation link...")
         # create an invitation link and store it in the DB
         invitation = create_invitation(user_details)
-        debug("new invitation: " + invitation["link_id"])
+        log.debug("new invitation: %s", invitation["link_id"])
         # send the invitation via email to the user
         send_invitation(user_details, request.url_root + "use_invitation?inv=" + invitation["link_id"])
 
@@ -174,9 +183,9 @@ def route_authenticate():
 @tamtzit.route('/')
 @require_login
 def route_home_page():
-    debug("top-level: do we know this user?")
+    log.debug("top-level: do we know this user?")
     db_user_info = get_user(user_id=user_data_from_req(request)[Cookies.COOKIE_USER_ID])
-    debug(f"user is {db_user_info}")
+    log.debug("user is %s", db_user_info)
     role = db_user_info['role']
 
     daily_summary_in_progress = check_if_daily_summary_in_progress('H1')
@@ -187,10 +196,10 @@ def route_home_page():
                                daily_summary_in_progress=(daily_summary_in_progress is not None),
                                next_translators=Markup(json.dumps(next_translators)))
     elif request.method == "HEAD":
-        debug("top-level: responding to head request with empty ...")
+        log.debug("top-level: responding to head request with empty ...")
         return ''
     else:
-        debug(f"top-level got unexpected request type {request.method}")
+        log.debug("top-level got unexpected request type %s", request.method)
         return "UH oh"
 
 
@@ -202,10 +211,10 @@ def get_font_sz_prefs(param_request):
         spd = json.loads(site_prefs)
         if "heb-font-size" in spd:
             heb_font_size = spd["heb-font-size"]
-            debug("/debug: overriding Hebrew font size from cookie: " + heb_font_size)
+            log.debug("/debug: overriding Hebrew font size from cookie: %s", heb_font_size)
         if "en-font-size" in spd:
             en_font_size = spd["en-font-size"]
-            debug("/debug: overriding English font size from cookie: " + en_font_size)
+            log.debug("/debug: overriding English font size from cookie: %s", en_font_size)
     return {"he": heb_font_size, "en": en_font_size}
 
 
@@ -219,7 +228,7 @@ def device_info():
 def route_set_settings():
     he_font_preference = request.form.get("he-font-size")
     en_font_preference = request.form.get("en-font-size")
-    debug(f"Changing settings: Hebrew font size is now {he_font_preference}, English is {en_font_preference}")
+    log.debug("Changing settings: Hebrew font size is now %s, English is %s", he_font_preference, en_font_preference)
     response = make_response(redirect("/"))
     prefs = {"heb-font-size": he_font_preference, "en-font-size": en_font_preference}
     response.set_cookie('tamtzit_prefs', json.dumps(prefs),
@@ -236,7 +245,7 @@ def refresh_cookies(param_request, response):
 
 @cachetools.func.ttl_cache(ttl=15)  # note that this only works when the method has an input param!
 def check_if_daily_summary_in_progress(lang):
-    debug("checking existence of daily summary")
+    log.debug("checking existence of daily summary")
     dt = datetime.now(ZoneInfo('Asia/Jerusalem'))
 
     # is there a daily summary draft from the last 3 hours [not a criteria: that's not yet "Done"]
@@ -247,8 +256,8 @@ def check_if_daily_summary_in_progress(lang):
             continue
 
         draft_last_mod = draft['last_edit']
-        debug(f"/check_if_daily_summary_in_progress: draft last edit: " +
-              f"{draft_last_mod}, now {dt}, delta: {dt - draft_last_mod}")
+        log.debug("/check_if_daily_summary_in_progress: draft last edit: %s, now %s, delta: %s",
+                  draft_last_mod, dt, dt - draft_last_mod)
         if (dt - draft_last_mod).seconds > (60 * 90):  # 1.5 hours 
             return None
         return draft
@@ -256,7 +265,7 @@ def check_if_daily_summary_in_progress(lang):
 
 @cachetools.func.ttl_cache(ttl=15)  # note that this only works when the method has an input param!
 def get_cachable_status(role):
-    debug("fetching uncached status info")
+    log.debug("fetching uncached status info")
     status_per_lang = {}
     now = datetime.now(tz=JERUSALEM_TZ)
     drafts = fetch_drafts(query_order="-last_edit")[0]
@@ -302,27 +311,27 @@ def route_get_status_json():
 @tamtzit.route("/use_invitation")
 def route_use_invitation_link():
     invitation = request.args.get("inv")
-    debug(f"use_invitation: checking invitation {invitation}")
+    log.debug("use_invitation: checking invitation %s", invitation)
     if not invitation or len(invitation) < 36:
         return "Badly formatted request - missing invitation paramter"
     if len(invitation) > 36:
         invitation = invitation[0:36]
-        debug(f"use_invitation: checking *trimmed* invitation {invitation}")
+        log.debug("use_invitation: checking *trimmed* invitation %s", invitation)
 
     if request.method == "GET":
         response = make_response(redirect("/"))
     elif request.method == "HEAD":
-        debug("use_invitation: responding to head request with empty ...")
+        log.debug("use_invitation: responding to head request with empty ...")
         return ''
     else:
-        debug(f"use_invitation got unexpected request type {request.method}")
+        log.debug("use_invitation got unexpected request type %s", request.method)
         return "UH oh"
 
     user_details = consume_invitation(invitation)
 
     if user_details:
 
-        debug(f"/use_invitation: valid invitation for user {user_details['email']}")
+        log.debug("/use_invitation: valid invitation for user %s", user_details['email'])
 
         new_cookie = make_daily_cookie(user_details)
         response.set_cookie(Cookies.ONE_DAY_SESSION, new_cookie, expires=datetime.now() + timedelta(days=1))
@@ -335,7 +344,7 @@ def route_use_invitation_link():
 
         return response
     else:
-        debug(f"use_invitation: returning an error - invitation seems invalid.")
+        log.debug("use_invitation: returning an error - invitation seems invalid.")
         return render_template("error.html", dont_show_home_link=True,
                                msg="Invalid authentication link. Please contact an admin.",
                                heb_msg="הלינק לא תקין, צור קשר עם משה")
@@ -385,18 +394,18 @@ def route_hebrew_template():
     # is there a Hebrew draft from the last 3 hours [not a criteria: that's not yet "Done"]
     drafts, local_tses = fetch_drafts()
     current_user_info = get_user(user_id=user_data_from_req(request)[Cookies.COOKIE_USER_ID])
-    debug(f"/heb: user={current_user_info['name']}, Drafts is {'' if drafts is None else 'not '} null")
+    log.debug("/heb: user=%s, Drafts is %s null", current_user_info['name'], '' if drafts is None else 'not ')
 
     dt = datetime.now(ZoneInfo('Asia/Jerusalem'))
     for draft in drafts:
         if draft['translation_lang'] != '--':
             continue
 
-        debug(f"/heb: should we show draft w/ lang={draft['translation_lang']}, " +
-              f"is_finished={'is_finished' in draft and draft['is_finished']}, " +
-              f"ok_to_translate={'ok_to_translate' in draft and draft['ok_to_translate']}")
+        log.debug("/heb: should we show draft w/ lang=%s, is_finished=%s, ok_to_translate=%s",
+                  draft['translation_lang'], 'is_finished' in draft and draft['is_finished'],
+                  'ok_to_translate' in draft and draft['ok_to_translate'])
         draft_last_mod = draft['last_edit']
-        debug(f"/heb: draft's last edit is {draft_last_mod}, it's now {dt}, delta is {dt - draft_last_mod}")
+        log.debug("/heb: draft's last edit is %s, it's now %s, delta is %s", draft_last_mod, dt, dt - draft_last_mod)
         if (dt - draft_last_mod).seconds > (60 * 90):  # 1.5 hours per Yair's choice 
             break
 
@@ -434,7 +443,7 @@ def route_hebrew_template():
 
     # if no current draft was found, create a new one so that we have a key to work with and save to while editing
     key = create_draft('', current_user_info, dt, translation_lang='--')
-    debug(f'Creating a new Hebrew draft with key {key.to_legacy_urlsafe().decode("utf8")}')
+    log.debug('Creating a new Hebrew draft with key %s', key.to_legacy_urlsafe().decode("utf8"))
     date_info = make_date_info(dt, 'he')
     header = make_header('he', date_info)
     footer = make_footer('he', date_info)
@@ -472,13 +481,13 @@ def route_keep_alive():
 def route_hebrew_edit_daily_summary():
     next_page = detect_mobile(request, "hebrew")
     current_user_info = get_user(user_id=user_data_from_req(request)[Cookies.COOKIE_USER_ID])
-    debug(f"/heb_edit_daily_summary: user={current_user_info['name']}")
+    log.debug("/heb_edit_daily_summary: user=%s", current_user_info['name'])
     dt = datetime.now(ZoneInfo('Asia/Jerusalem'))
 
     if request.method == 'POST':
         key = create_draft(heb_text='', user_info=current_user_info, draft_timestamp=dt, translation_lang='H1')
 
-        debug(f'Creating a new H1 draft with key {key.to_legacy_urlsafe().decode("utf8")}')
+        log.debug('Creating a new H1 draft with key %s', key.to_legacy_urlsafe().decode("utf8"))
         date_info = make_date_info(dt, 'he')
         header = make_header('H1', date_info)
         footer = make_footer('H1', date_info)
@@ -508,10 +517,10 @@ def route_hebrew_edit_daily_summary():
         date_info = make_date_info(dt, 'he')
 
         editor_name = "עוד לא ידוע"
-        debug("checking what name to use for the editor...")
+        log.debug("checking what name to use for the editor...")
         if "editor" in current_user_info["role"]:
             editor_name = current_user_info["name_hebrew"]
-        debug(f"set editor name to {editor_name}")
+        log.debug("set editor name to %s", editor_name)
 
         response = make_response(
             render_template(next_page, date_info=date_info, heb_text=Markup(draft['hebrew_text']),
@@ -542,7 +551,7 @@ def route_hebrew_restart():
 
     # is there a Hebrew draft from the last 3 hours [not a criteria: that's not yet "Done"]
     drafts, local_tses = fetch_drafts()
-    debug("Drafts is " + ("" if drafts is None else "not ") + "null")
+    log.debug("Drafts is %snull", "" if drafts is None else "not ")
 
     dt = datetime.now(ZoneInfo('Asia/Jerusalem'))
     for draft in drafts:
@@ -550,11 +559,11 @@ def route_hebrew_restart():
             continue
 
         draft_last_mod = draft['last_edit']
-        debug(f"/heb-restart: draft's last edit is {draft_last_mod}, it's now {dt}, delta is {dt - draft_last_mod}")
+        log.debug("/heb-restart: draft's last edit is %s, it's now %s, delta is %s", draft_last_mod, dt, dt - draft_last_mod)
         if (dt - draft_last_mod).seconds > (60 * 90):  # 1.5 hours per Yair's choice 
             break
         else:
-            debug("/heb-restart: Overriding last edit time of most recent Hebrew draft")
+            log.debug("/heb-restart: Overriding last edit time of most recent Hebrew draft")
             edit_timestamp = datetime.now(tz=ZoneInfo('Asia/Jerusalem')) + timedelta(hours=-2)
             draft.update({"last_edit": edit_timestamp})
             draft.update({"is_finished": True})
@@ -562,12 +571,22 @@ def route_hebrew_restart():
             prev_states.append({"state": DraftStates.ADMIN_CLOSED.name, "at": dt.strftime('%Y%m%d-%H%M%S'),
                                 "by": db_user_info["name"], "by_heb": db_user_info["name_hebrew"]})
             draft.update({"states": prev_states})
+            set_derived_draft_fields(draft)
             datastore_client.put(draft)
             break
 
     return make_response(redirect("/"))
 
 
+@tamtzit.route("/backfill-draft-fields")
+@require_login
+@require_role("admin")
+def route_backfill_draft_fields():
+    # run once after deploying the version which stores the derived draft fields, see set_derived_draft_fields()
+    deferred.defer(backfill_derived_draft_fields)
+    return "Backfill started"
+
+
 @tamtzit.route("/set-debug-mode")
 @require_login
 @require_role("admin")
@@ -582,10 +601,10 @@ def route_mark_published():
     edition_lang = request.args.get("lang")
     db_user_info = get_user(user_id=user_data_from_req(request)[Cookies.COOKIE_USER_ID])
 
-    debug(f"mark_published: {edition_lang} has been copied by {db_user_info['name']}")
+    log.debug("mark_published: %s has been copied by %s", edition_lang, db_user_info['name'])
 
     drafts, local_tses = fetch_drafts()
-    debug("Drafts is " + ("" if drafts is None else "not ") + "null")
+    log.debug("Drafts is %snull", "" if drafts is None else "not ")
 
     dt = datetime.now(ZoneInfo('Asia/Jerusalem'))
     for draft in drafts:
@@ -593,20 +612,21 @@ def route_mark_published():
             continue
 
         draft_last_mod = draft['last_edit']
-        debug(f"/mark_published: draft's last edit is {draft_last_mod}, it's now {dt}, delta is {dt - draft_last_mod}")
+        log.debug("/mark_published: draft's last edit is %s, it's now %s, delta is %s", draft_last_mod, dt, dt - draft_last_mod)
         if (dt - draft_last_mod).seconds > (60 * 90):
             # 1.5 hours - if admin is going to publish by copying from the dash, it will certainly be within that time!
             break
         else:
             prev_states = draft["states"]
             if DraftStates.PUBLISHED.name in [st["state"] for st in prev_states]:
-                debug("/mark_published: most recent Hebrew draft has already been published")
+                log.debug("/mark_published: most recent Hebrew draft has already been published")
                 break
             if DraftStates.PUBLISH_READY.name in [st["state"] for st in prev_states]:
-                debug("/mark_published: marking most recent Hebrew draft as published")
+                log.debug("/mark_published: marking most recent Hebrew draft as published")
                 prev_states.append({"state": DraftStates.PUBLISHED.name, "at": dt.strftime('%Y%m%d-%H%M%S'),
                                     "by": db_user_info["name"], "by_heb": db_user_info["name_hebrew"]})
             draft.update({"states": prev_states})
+            set_derived_draft_fields(draft)
             datastore_client.put(draft)
             break
 
@@ -618,22 +638,22 @@ def route_mark_published():
 def route_mark_edit_ready():
     draft_id_key = request.args.get('draft_id')
     if draft_id_key is None:
-        debug("ERROR: /mark_edit_ready got no draft_id!")
+        log.debug("ERROR: /mark_edit_ready got no draft_id!")
         return None
 
     draft_id = Key.from_legacy_urlsafe(draft_id_key)
     if draft_id is None:
-        debug("ERROR: /mark_edit_ready got invalid draft_id!")
+        log.debug("ERROR: /mark_edit_ready got invalid draft_id!")
         return
 
     draft = datastore_client.get(draft_id)
     if draft is None:
-        debug("ERROR: /mark_edit_ready unable to find matching draft data!")
+        log.debug("ERROR: /mark_edit_ready unable to find matching draft data!")
         return None
 
     prev_states = draft["states"]
     if DraftStates.EDIT_READY.name in [st["state"] for st in prev_states]:
-        debug("/mark_edit_ready: draft has already been marked ready for editing")
+        log.debug("/mark_edit_ready: draft has already been marked ready for editing")
         return "OK"
     
     dt = datetime.now(ZoneInfo('Asia/Jerusalem'))
@@ -642,6 +662,7 @@ def route_mark_edit_ready():
     prev_states.append({"state": DraftStates.EDIT_READY.name, "at": dt.strftime('%Y%m%d-%H%M%S'),
                         "by": db_user_info["name"], "by_heb": db_user_info["name_hebrew"]})
     draft.update({"states": prev_states})
+    set_derived_draft_fields(draft)
     datastore_client.put(draft)
 
     return "OK"
@@ -716,7 +737,7 @@ def route_continue_draft():
             heb_drafts = [d for d in drafts if d.key.id == int(draft['heb_draft_id'])]
             heb_draft = heb_drafts.pop() if len(heb_drafts) > 0 else None
             if not heb_draft:
-                debug("/draft: ERR - unable to find original Hebrew draft!")
+                log.debug("/draft: ERR - unable to find original Hebrew draft!")
                 heb_draft = draft
 
             return render_template(next_page, orig_heb_text=Markup(draft['hebrew_text']),
@@ -742,7 +763,7 @@ def route_translate():
        /translate creates a new entry based on the submission of the form at /  (POST)
        /draft     edits an existing entry based on a link on the main page      (GET)
     """
-    debug("/translate BEGIN")
+    log.debug("/translate BEGIN")
     basic_user_info = user_data_from_req(request)
     user_info = get_user(user_id=basic_user_info["user_id"])
     transaction_context = {"user_info": user_info}
@@ -752,50 +773,44 @@ def route_translate():
     translation_engine = request.form.get("tx_engine")
     target_language_code = request.form.get('target_lang')
 
-    debug(f"/translate - engine is {translation_engine}")
+    log.debug("/translate - engine is %s", translation_engine)
 
     if translation_engine.startswith("OpenAI"):
         if "use_async_results" not in request.form or request.form.get("use_async_results") != "True":
-            debug(f"Create an ASYNC request")
-            # create a request for asynchronous translation - we get here based on submit of input.html
             openAI_model = translation_engine.split("-", 1)[1]
-
-            key = datastore_client.key("async_job")
-            entity = datastore.Entity(key=key, exclude_from_indexes=("translation_result", "translation_custom_dirs", "heb_text"))
-            entity.update({"created_at": draft_timestamp,
-                           "created_by": user_info["name"],
-                           "operation": "translation",
-                           "translation_lang": target_language_code,
-                           "heb_draft_id": request.form.get('heb_draft_id'),
-                           "heb_author_id": request.form.get('heb_author_id'),
-                           "heb_text": heb_text,
-                           "translation_engine": "openai/" + openAI_model,
-                           "translation_custom_dirs": request.form.get("openai-custom-dirs"),
-                           "translation_result": ""  # necessary to get it to save exclude from indexes
-                           })
-            datastore_client.put(entity)
-            entity = datastore_client.get(entity.key)
-
-            # call an endpoint exposed by the async processor to let it know there's a pending request
-            debug(f"route_translate: calling requests.get({os.getenv('ASYNC_PROCESSOR_URL')}{entity.key.id})")
-            requests.get(f"{os.getenv('ASYNC_PROCESSOR_URL')}{entity.key.id}")
-
-            # return a *new* page - OpenAI is processing your request, this page will auto-refresh when it is ready
-            return render_template("async_pending.html", async_request_id=entity.key.id,
-                                   heb_draft_id=request.form.get('heb_draft_id'),
-                                   heb_author_id=request.form.get('heb_author_id'),
-                                   orig_text=heb_text,
-                                   target_lang=target_language_code)
+            custom_dirs = request.form.get("openai-custom-dirs")
+
+            # usually the translation was already started when the Hebrew was marked ok-to-translate
+            job = get_reusable_speculative_job(request.form.get('heb_draft_id'), target_language_code,
+                                               openAI_model, custom_dirs, heb_text)
+            if job is not None and job.get("job_status") != AsyncJobStatus.DONE.name:
+                log.debug("Waiting on speculative ASYNC request %s", job.key.id)
+            elif job is None:
+                log.debug("Create an ASYNC request")
+                # create a request for asynchronous translation - we get here based on submit of input.html
+                job = create_async_translation_job(heb_text, target_language_code, openAI_model,
+                                                   heb_draft_id=request.form.get('heb_draft_id'),
+                                                   heb_author_id=request.form.get('heb_author_id'),
+                                                   created_by=user_info["name"], custom_dirs=custom_dirs)
+
+            if job.get("job_status") != AsyncJobStatus.DONE.name:
+                # return a *new* page - OpenAI is processing your request, this page will auto-refresh when it is ready
+                return render_template("async_pending.html", async_request_id=job.key.id,
+                                       heb_draft_id=job["heb_draft_id"],
+                                       heb_author_id=job["heb_author_id"],
+                                       orig_text=job["heb_text"],
+                                       target_lang=target_language_code)
+            log.debug("Using finished speculative ASYNC request %s", job.key.id)
         else:
-            debug("Using ASYNC results")
+            log.debug("Using ASYNC results")
             # fetch and process the results of asynchronous translation - we get here based on call from async_pending.html
             job = datastore_client.get(datastore_client.key("async_job", int(request.form.get("tx_async_request_id"))))
 
-            transaction_context["heb_draft_id"] = job["heb_draft_id"]
-            transaction_context["translation_result"] = job["translation_result"]
-            heb_text = job["heb_text"]
-            heb_author_id = job["heb_author_id"]
-            target_language_code = job["translation_lang"]
+        transaction_context["heb_draft_id"] = job["heb_draft_id"]
+        transaction_context["translation_result"] = job["translation_result"]
+        heb_text = job["heb_text"]
+        heb_author_id = job["heb_author_id"]
+        target_language_code = job["translation_lang"]
     else:
         # we're translating with Google
 
@@ -837,24 +852,59 @@ def route_translate():
     return make_response(redirect(url_for("tamtzit.route_continue_draft", ts=utc_draft_timestamp_str, edit="true")))
 
 
+# the async processor calls /async_job_done when a job is finished; that sets a memcache flag which a
+# long-polling /check_async?wait=N is watching, so the pending page learns about it right away without
+# hitting the DB every few seconds. Memcache can be evicted, so a request which times out still checks the DB.
+ASYNC_DONE_KEY_PREFIX = "async_job_done_"
+ASYNC_CHECK_MAX_WAIT_SECS = 30
+ASYNC_CHECK_MEMCACHE_INTERVAL_SECS = 0.5
+
+
+@tamtzit.route("/async_job_done", methods=['POST'])
+def route_async_job_done():
+    # not a user-facing endpoint, so there's no login - the async processor proves itself with a shared secret
+    expected_secret = os.getenv("ASYNC_CALLBACK_SECRET")
+    if not expected_secret or not hmac.compare_digest(request.headers.get("X-Async-Callback-Secret", ""),
+                                                      expected_secret):
+        return "Forbidden", 403
+    job_id = request.form.get('async_request_id')
+    if job_id is None or not job_id.isdigit():
+        return "Error - missing parameter", 400
+    log.debug("route_async_job_done: job %s finished with %s", job_id, request.form.get('result_code'))
+    memcache.set(ASYNC_DONE_KEY_PREFIX + job_id, request.form.get('result_code', ''), time=600)
+    return "OK"
+
+
 @tamtzit.route("/check_async")
 def route_check_async():
-    debug(f"route_check_async: async_request_id is {request.args.get('async_request_id')}")
+    log.debug("route_check_async: async_request_id is %s", request.args.get('async_request_id'))
     if request.args.get('async_request_id') is None or not request.args.get('async_request_id').isdigit():
         return "Error - missing parameter"
+    wait = request.args.get('wait', '0')
+    wait = min(int(wait), ASYNC_CHECK_MAX_WAIT_SECS) if wait.isdigit() else 0
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if memcache.get(ASYNC_DONE_KEY_PREFIX + request.args.get('async_request_id')) is not None:
+            break
+        time.sleep(ASYNC_CHECK_MEMCACHE_INTERVAL_SECS)
+
     my_job = datastore_client.get(datastore_client.key("async_job", int(request.args.get('async_request_id'))))
     if my_job and "result_code" in my_job:
-        return my_job["result_code"]
-    return "Pending"
+        return {"status": my_job["result_code"], "progress": 100, "partial": ""}
+    if my_job:
+        # while OpenAI is still working, show the translator whatever has been streamed back so far
+        return {"status": "Pending", "progress": my_job.get("translation_progress", 0),
+                "partial": my_job.get("translation_partial", "")}
+    return {"status": "Pending", "progress": 0, "partial": ""}
 
 
 @tamtzit.route("/saveDraft", methods=['POST'])
 @require_login
 def save_draft():
-    debug(f"saveDraft: draft_key is {request.form.get('draft_key')}")
+    log.debug("saveDraft: draft_key is %s", request.form.get('draft_key'))
     draft_key = Key.from_legacy_urlsafe(request.form.get('draft_key'))
     if draft_key is None:
-        debug("ERROR: /saveDraft got None draft_key!")
+        log.debug("ERROR: /saveDraft got None draft_key!")
         return
     finished = request.form.get('is_finished') and request.form.get('is_finished').lower() == 'true'
     send_to_translators = request.form.get('to_translators') and request.form.get('to_translators').lower() == 'true'
@@ -875,42 +925,43 @@ def save_draft():
         else:
             return "Error: saveDraft called with change to Hebrew text, but user does not have the appropriate role."
     else:
-        debug("ERROR: /saveDraft didn't get the input it was expecting!")
+        log.debug("ERROR: /saveDraft didn't get the input it was expecting!")
         return "ERROR - saveDraft called without translation or source_text fields"
     return "OK"
 
 
 @tamtzit.route("/getUntranslatedAdditions", methods=["GET"])
 def get_untranslated_additions():
-    debug(f"get_untranslated_additions: heb_draft_id is {request.args.get('heb_draft_id')}")
+    log.debug("get_untranslated_additions: heb_draft_id is %s", request.args.get('heb_draft_id'))
     heb_draft_id = request.args.get('heb_draft_id')
     if heb_draft_id is None:
-        debug("ERROR: /getUntranslatedAdditions got None heb_draft_id!")
+        log.debug("ERROR: /getUntranslatedAdditions got None heb_draft_id!")
         return None
     # actually we want to compare with the draft as it was when the translation being worked on was created
     # - which is saved in the hebrew_text field of the draft object!
     translation_draft_id = Key.from_legacy_urlsafe(request.args.get('translation_draft_id'))
     if translation_draft_id is None:
-        debug("ERROR: /getUntranslatedAdditions got None translation_draft_id!")
+        log.debug("ERROR: /getUntranslatedAdditions got None translation_draft_id!")
         return
 
     heb_draft = datastore_client.get(datastore_client.key("draft", int(heb_draft_id)))
     if heb_draft is None:
-        debug("ERROR: /getUntranslatedAdditions got None matching hebrew_draft!")
+        log.debug("ERROR: /getUntranslatedAdditions got None matching hebrew_draft!")
         return None
 
     translated_draft = datastore_client.get(translation_draft_id)
     if translated_draft is None:
-        debug("ERROR: /getUntranslatedAdditions got None matching translated_draft!")
+        log.debug("ERROR: /getUntranslatedAdditions got None matching translated_draft!")
         return None
 
     lang = request.args.get('lang')
     try:
         additions_by_section, translated_additions_by_section = (
             get_translated_additions_since_ok_to_tx(
-                heb_draft['hebrew_text'], translated_draft['hebrew_text'], target_lang=lang))
+                heb_draft['hebrew_text'], translated_draft['hebrew_text'], target_lang=lang,
+                heb_draft_id=heb_draft.key.id, translation_draft_id=translated_draft.key.id))
     except Exception:  # noqa eventually I should find the right exception classes
-        debug("There was an error trying to get deltas, returning no deltas.")
+        log.debug("There was an error trying to get deltas, returning no deltas.")
         additions_by_section = translated_additions_by_section = {}
 
     response = Markup(json.dumps({"additions": additions_by_section,
@@ -934,11 +985,11 @@ def start_daily_summary():
         raise ValueError("Invalid lang parameter for start_daily_summary")
 
     # this is a map from edition name (morning, afternoon, eve) to a draft object
-    debug(f"start_daily_summary: getting yesterday's editions...")
+    log.debug("start_daily_summary: getting yesterday's editions...")
     todays_editions = get_latest_day_worth_of_editions()[lang]
     organized_editions = {}
     for edition_time_of_day in todays_editions:
-        debug(f"start_daily_summary: processing {edition_time_of_day}")
+        log.debug("start_daily_summary: processing %s", edition_time_of_day)
         edition = todays_editions[edition_time_of_day]
         processed_text_info = (
             process_translation_request(edition['hebrew_text' if lang == 'he' else 'translation_text'], lang))
@@ -1011,18 +1062,18 @@ def route_translation_current_schedule():
         editions_to_skip = editions_to_skip['available']
 
     query = datastore_client.query(kind="translation_schedule")
-    debug(f"tx_schedule_curr: fetching schedule for week of {sched_week}")
+    log.debug("tx_schedule_curr: fetching schedule for week of %s", sched_week)
     query.add_filter(filter=PropertyFilter("week_from", "=", sched_week))
     schedule_info = query.fetch()
     schedule = None
     for s in schedule_info:
-        debug("got a schedule from the db...")
+        log.debug("got a schedule from the db...")
         schedule = s['schedule']
 
     # we also need to pull user info and make a mapping of user fname lname-initial to color
     # so that user schedule colors are taken from the db rather than hard-coded in tx_schedule.html
 
-    debug(f"tx_schedule_curr: passing data: {schedule}")
+    log.debug("tx_schedule_curr: passing data: %s", schedule)
 
     return render_template("tx_schedule.html", week=sched_obj.week,
                            editions_to_skip=Markup(json.dumps(editions_to_skip)),
@@ -1049,7 +1100,7 @@ def route_translation_schedule_signup():
     if not is_summer_daylight_savings_time:
         editions_to_skip["available"]["Saturday"][1] = 0
 
-    debug("tx_schedule_signup returning availability: " + Markup(usa_as_json))
+    log.debug("tx_schedule_signup returning availability: %s", Markup(usa_as_json))
     return render_template("tx_signup.html", week=sched_obj.week,
                            with_early_motzash=not is_summer_daylight_savings_time,
                            week_being_scheduled=sched_dates['week_being_scheduled'],
@@ -1147,9 +1198,9 @@ def route_translation_schedule_thisweek_change():
 def route_translation_build_next_schedule():
     # as this is meant to be called only by the App Engine scheduler, we check an expected header
     # and if it's not there, reject the request
-    debug("Building next week's translation schedule...")
+    log.debug("Building next week's translation schedule...")
     # if 'X-Appengine-Cron' not in request.headers or request.headers['X-Appengine-Cron'] != 'true':
-    #     debug("This request does not come from AppEngine, so ignoring it.")
+    #     log.debug("This request does not come from AppEngine, so ignoring it.")
     #     return
 
     sched_dates = get_scheduling_dates()
@@ -1196,78 +1247,62 @@ def route_translation_build_next_schedule():
 def nightly_archive_cleanup():
     # as this is meant to be called only by the App Engine scheduler, we check an expected header
     # and if it's not there, reject the request
-    debug("Cleaning the day's archive entries...")
+    log.debug("Cleaning the day's archive entries...")
     if 'X-Appengine-Cron' not in request.headers or request.headers['X-Appengine-Cron'] != 'true':
-        debug("This request does not come from AppEngine, so ignoring it.")
+        log.debug("This request does not come from AppEngine, so ignoring it.")
         return
 
-    debug(f"n_a_c headers look good, progressing")
+    log.debug("n_a_c headers look good, progressing")
     yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
 
     # make a map of each language's most mature editions from the last day
     yesterdays_editions = get_latest_day_worth_of_editions()
 
-    # For each language which is archived:
-    for lang in ['he', 'en', 'fr']:
-        debug(f"n_a_c cleaning up archive for {lang}")
-
-        # step 1: get the relevant archive page
-        prev_archive = requests.get(f"{ARCHIVE_BASE}archive-{lang}.html").text
-        soup = BeautifulSoup(prev_archive, "html.parser")
-        next_entry_tag = soup.find(id='next-entry')  # we'll use it later to insert content
-        debug(f"n_a_c archive fetched")
-
-        # step 2: strip out all of yesterday's entries from the archives, if any
-        for div in soup.find_all("div"):
-            div: Tag
-            if div is None:
-                debug("Strange - got a None div, continuing...")
-                continue
-            if div.decomposed:
-                debug("Skipping an inner decomposed div")
-                continue
-            if div.attrs is None:
-                debug("Strange - div's attrs is None. Probably the inner div of the div we just deleted, continuing...")
-                continue
-            if 'id' not in div.attrs:
-                debug(f"Deleting a div with no id: {div}")
-                div.decompose()
-                continue
-            if div.attrs['id'] == 'next-entry':
-                debug("skipping next-entry div")
-                continue
-            if div.attrs['id'].startswith(yesterday):
-                debug(f"deleting a yesterday div: \n{div}")
-                div.decompose()
-                continue
-        debug("n_a_c Done deleting yesterday's entries")
-
-        # step 3: insert (in reverse chronological order) 1 entry for each of yestderday's editions        
-        for edition_time_of_day in reversed(yesterdays_editions[lang]):
-            edition = yesterdays_editions[lang][edition_time_of_day]
-            anchor = edition['timestamp'].astimezone(JERUSALEM_TZ).strftime('%Y-%m-%d') + '-' + edition_time_of_day
-
-            make_new_archive_entry(soup, next_entry_tag, edition, anchor, lang)
-            debug(f"n_a_c inserted entry for {edition_time_of_day}")
-
-            # step 3b: save state change history to our audit table
-            key = datastore_client.key("audit")
-            entity = datastore.Entity(key=key)
+    # save state change history to our audit table
+    audit_entities = []
+    for lang in ARCHIVE_LANGS:
+        for edition_time_of_day, edition in yesterdays_editions[lang].items():
+            entity = datastore.Entity(key=datastore_client.key("audit"))
             entity.update({"date": yesterday, "edition": edition_time_of_day, "lang": lang,
                            "states": edition['states']})
-            datastore_client.put(entity)
+            audit_entities.append(entity)
+    datastore_client.put_multi(audit_entities)
+
+    # each language's archive is separate, so they're all brought up to date at once.
+    # If one fails, the others still get done
+    failed_langs = []
+    with ThreadPoolExecutor(max_workers=len(ARCHIVE_LANGS)) as executor:
+        futures = {lang: executor.submit(republish_day, lang, yesterday, yesterdays_editions[lang])
+                   for lang in ARCHIVE_LANGS}
+        for lang, future in futures.items():
+            try:
+                future.result()
+            except Exception:  # noqa - report it and carry on with the other languages
+                log.exception("nightly_archive_cleanup: failed to clean up the %s archive", lang)
+                failed_langs.append(lang)
+
+    if failed_langs:
+        return f"Failed for: {', '.join(failed_langs)}", 500
+    return "OK"
 
-        # step 4: push the updated page back to cloud storage
-        upload_to_cloud_storage(f"archive-{lang}.html", str(soup))
 
-    return "OK"
+# which section a line of an edition starts, by the keywords found in it - the first match in the list wins
+BULLET_LINE_SECTIONS = [("southern", "SOUTH"), ("northern", "NORTH"), ("yemen", "YEMEN"), ("jands", "YandS"),
+                        ("rising-lion", "RISING-LION")]
+PIN_LINE_SECTIONS = [("security", "Security"), ("in israel", "InIsrael"), ("world", "Worldwide"),
+                     ("policy", "PandP"), ("weather", "Weather"), ("economy", "Economy"), ("sport", "Sports"),
+                     ("finish", "FinishWell")]
+keyword_matchers = {lang: KeywordMatcher(keywords[lang]) for lang in keywords}
 
 
 def process_translation_request(heb_text, target_language_code, translation_engine="Google",
-                                transaction_context: dict = {}):
+                                transaction_context: dict = None):
+    if transaction_context is None:
+        transaction_context = {}
 
     if heb_text is not None and len(heb_text) > 0:
-        heb_text = strip_header_and_footer(heb_text, target_language_code)
+        heb_text = strip_header_and_footer(heb_text, target_language_code,
+                                           draft_id=transaction_context.get("heb_draft_id"))
 
     if target_language_code in ["YY", "he"]:
         translated = heb_text
@@ -1278,39 +1313,29 @@ def process_translation_request(heb_text, target_language_code, translation_engi
             translated = translate_text(heb_text, target_language_code=target_language_code,
                                     engine=translation_engine, transaction_context=transaction_context)
 
-    debug(f"RAW TRANSLATION:--------\n{translated}")
-    debug(f"--------------------------")
+    log.debug("RAW TRANSLATION:--------\n%s", translated)
+    log.debug("--------------------------")
 
     heb_text = Markup(heb_text)  # .replace("\n", "<br>"))
     translated_lines = translated.split("\n")
 
-    kw = keywords[target_language_code]
-    section_titles = sections[target_language_code]
-
-    def kw_match(keywords, line):
-        if type(keywords) is str:
-            return keywords in line
-        elif type(keywords) is list:
-            for keyword in keywords:
-                if keyword in line:
-                    return True
-        return False
+    keyword_matcher = keyword_matchers[target_language_code]
 
     section = None
     organized = defaultdict(list)
     for line in translated_lines:
         line = line.strip()
-        debug(f"{len(line)}: {line}")
+        log.debug("%d: %s", len(line), line)
         if len(line) == 0:
-            debug("skipping a blank line")
+            log.debug("skipping a blank line")
             continue
         if "📻" in line:
-            debug("skipping radio icon line")
+            log.debug("skipping radio icon line")
             continue
         if "• • •" in line or "•   •   •" in line:
-            debug("Found three dot line")
+            log.debug("Found three dot line")
             if "NORTH" in organized or "SOUTH" in organized:
-                debug("post three dots, skipping")
+                log.debug("post three dots, skipping")
                 # we've processed the main body and moved to a section at the bottom 
                 # which should be ignored
                 break
@@ -1318,76 +1343,49 @@ def process_translation_request(heb_text, target_language_code, translation_engi
                 # @TODO
                 # this is where we need to check if we've got a special header, e.g. motzei Shabbat,
                 # and need to ignore it rather than add it to UNKNOWN
-                debug("post three dots, switching to 'unknown'")
+                log.debug("post three dots, switching to 'unknown'")
                 section = organized['UNKNOWN']
                 continue
-        if section is None and (kw_match(kw["edition"], line.lower())) and '202' in line.lower():
-            debug("skipping what looks like the intro edition line")
+        lower_line = line.lower()
+        kinds = keyword_matcher.kinds_in(lower_line)   # which keywords are in the line, all found at once
+        if section is None and "edition" in kinds and '202' in lower_line:
+            log.debug("skipping what looks like the intro edition line")
             continue
         if line.startswith("> "):
-            debug("bullet line...")
-            if (kw_match(kw["southern"], line.lower())) and 'SOUTH' not in organized:
-                debug("starting south section")
-                section = organized['SOUTH']
-            elif (kw_match(kw["northern"], line.lower())) and 'NORTH' not in organized:
-                debug("starting north section")
-                section = organized['NORTH']
-            elif (kw_match(kw["yemen"], line.lower())) and "YEMEN" not in organized:
-                debug("starting Yemen section")
-                section = organized['YEMEN']
-            elif (kw_match(kw["jands"], line.lower())) and 'YandS' not in organized:
-                debug("starting J&S section")
-                section = organized['YandS']
-            elif (kw_match(kw["rising-lion"], line.lower())) and 'RISING-LION' not in organized:
-                debug("starting RISING-LION section")
-                section = organized['RISING-LION']
+            log.debug("bullet line...")
+            # the first of these whose keyword is in the line starts that section, unless it already exists
+            new_section_id = next((section_id for kind, section_id in BULLET_LINE_SECTIONS
+                                   if kind in kinds and section_id not in organized), None)
+            if new_section_id:
+                log.debug("starting %s section", new_section_id)
+                section = organized[new_section_id]
             # elif kw["policy"] in line.lower() and "politics" in line.lower() and 'PandP' not in organized:
-            #     debug("starting policy section")
+            #     log.debug("starting policy section")
             #     section = organized['PandP']
             # elif kw["in the world"] in line.lower() and "Worldwide" not in organized:
-            #     debug("starting world section")
+            #     log.debug("starting world section")
             #     section = organized["Worldwide"]
             elif section is not None:
-                debug(f"inside section {section}")
+                log.debug("inside section %s", section)
                 section.append(Markup(line))
         elif line.startswith("📌"):
-            debug("pin line...")
-            if kw_match(kw["intro_pin"], line.lower()):
-                debug("skipping what looks like the intro pin line")
+            log.debug("pin line...")
+            if "intro_pin" in kinds:
+                log.debug("skipping what looks like the intro pin line")
                 continue
-            if kw_match(kw["security"], line.lower()):
-                debug("starting Security section")
-                section = organized['Security']
-            elif kw_match(kw["in israel"], line.lower()):
-                debug("starting inIsrael section")
-                section = organized['InIsrael']
-            elif kw_match(kw["world"], line.lower()):
-                debug("starting world section")
-                section = organized["Worldwide"]
-            elif kw_match(kw["policy"], line.lower()):
-                debug("starting policy section")
-                section = organized['PandP']
-            elif kw_match(kw["weather"], line.lower()):
-                debug("Starting weather section")
-                section = organized['Weather']
-            elif kw_match(kw["economy"], line.lower()):
-                debug("Starting economy section")
-                section = organized["Economy"]
-            elif kw_match(kw["sport"], line.lower()):
-                debug("Starting sports section")
-                section = organized["Sports"]
-            elif kw_match(kw["finish"], line.lower()):
-                debug("Starting good news section")
-                section = organized['FinishWell']
+            new_section_id = next((section_id for kind, section_id in PIN_LINE_SECTIONS if kind in kinds), None)
+            if new_section_id:
+                log.debug("starting %s section", new_section_id)
+                section = organized[new_section_id]
             else:
                 section = organized['UNKNOWN']
-                debug("Adding to unknown: " + line)
+                log.debug("Adding to unknown: %s", line)
                 section.append(Markup(line))
         else:
-            debug("regular text line")
+            log.debug("regular text line")
             if section is None:
                 section = organized['UNKNOWN']
-                debug("Adding to unknown (b): " + line)
+                log.debug("Adding to unknown (b): %s", line)
 
             section.append(Markup(line))
 
@@ -0,0 +1,256 @@
+##################################################################################
+#
+# Team Text Editing, Translation and Review Coordination tool
+# Copyright (C) 2023-2025, Moshe Sambol, https://github.com/mjsambol
+#
+# Originally created for the Tamtzit Hachadashot / News In Brief project
+# of the Lokhim Ahrayut non-profit organization
+# Published in English as "Israel News Highlights"
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+#################################################################################
+
+############################################
+# Terminology substitutions applied around machine translation
+#
+# pre_translation_swaps replaces Hebrew terms which Google gets wrong with our own translations before the text is
+# sent, and post_translation_swaps fixes up terminology in whatever comes back from Google or OpenAI.
+#
+# The rules themselves are in the glossary (see glossary.py). They used to be a long list of re.sub calls, each one
+# a separate pass over the text (and most of them compiled from an f-string on every call). Now each language's rules
+# are compiled once per glossary version into a single alternation regex, and a translation costs one scan of the
+# text (two before translating, see GlossarySwaps).
+#
+# Doing it in one scan gives the same result as applying the rules one after the other, in order, as long as
+#   - where two rules could match overlapping text, the one listed first wins. Within the alternation that is true
+#     when they start at the same place; when a later rule starts first it gets a negative lookahead (for titles
+#     this is worked out automatically in make_title_rule, see there)
+#   - no rule needs to match the *output* of an earlier one. Where the old code relied on that ("an alarm" became
+#     "an siren" and then "a siren") the chain is written out as a single rule listed before its parts.
+# benchmarks/bench_translation_swaps.py compares this against the old implementation; run it after changing rules.
+
+import re
+
+from common import debug
+from glossary import for_current_glossary
+
+
+def vav_hey(title):
+    # this lambda works but is a bit hard to read
+    # return lambda match: ("and " if match.group(1).startswith("ו") else '') + ("the " + title if match.group(2).startswith("ה") else title)
+    def translate_prefix(match):
+        result = ''
+        if match.group(1).startswith('ו'):
+            result = 'and '
+        if match.group(2).startswith('ה'):
+            result = result + 'the '
+        result += title
+        return result
+    return translate_prefix
+
+
+def tx_heb_prefix(word, lang):
+    # use caution - assumes that the letters בולמה are intended as prefixes
+    # do not use this with words which have one of those letters as part of the main word!
+    if not word or not lang or word == "" or lang == "":
+        debug(f"tx_heb_prefix: uhoh got {word} - {lang}")
+        return ""
+    result = ""
+    if lang == "en":
+        for char in word:
+            if char == "ב":
+                result = result + "in "
+            if char == "ו":
+                result = result + "and "
+            if char == "ל":
+                result = result + "to "
+            if char == "מ":
+                result = result + "from "
+            if char == "ה":
+                result = result + "the "
+    elif lang == "fr":
+        for char in word:
+            if char == "ב":
+                result = result + "en "
+            if char == "ו":
+                result = result + "et "
+            if char == "ל":
+                result = result + "à "
+            if char == "מ":
+                result = result + "dès "
+            if char == "ה":
+                result = result + "la "
+    return result
+
+
+class RuleMatch:
+    # what a rule's replacement function is given instead of the real match object: group numbers are relative to
+    # the rule's own pattern rather than to the combined pattern it has been compiled into
+    __slots__ = ("match", "first_group")
+
+    def __init__(self, match, first_group):
+        self.match = match
+        self.first_group = first_group
+
+    def group(self, index=0):
+        if index == 0:
+            return self.match.group(0)
+        return self.match.group(self.first_group + index - 1)
+
+
+class SwapEngine:
+
+    def __init__(self, rules) -> None:
+        # rules is an ordered list of (pattern, replacement) pairs, earlier rules take priority.
+        # replacement is either the literal replacement text or a function which takes the match and returns it
+        self.replacements = {}
+        alternatives = []
+        word_start_alternatives = []
+        group_number = 0
+        for pattern, replacement in rules:
+            rule_groups = re.compile(pattern).groups
+            # an empty group after each rule's pattern closes last, so match.lastindex tells us which rule matched.
+            # (Wrapping the rule in a group would also work, but then the regex engine can no longer skip an
+            # alternative by looking at its first character, which makes it several times slower.)
+            group_number += rule_groups + 1
+            self.replacements[group_number] = (replacement, group_number - rule_groups)
+            # almost every position in the text is not the start of a word, so \b is checked once for a run of
+            # rules which start with it rather than once per rule
+            if pattern.startswith(r"\b"):
+                word_start_alternatives.append(f"(?:{pattern[2:]})()")
+                continue
+            if word_start_alternatives:
+                alternatives.append(r"\b(?:" + "|".join(word_start_alternatives) + ")")
+                word_start_alternatives = []
+            alternatives.append(f"(?:{pattern})()")
+        if word_start_alternatives:
+            alternatives.append(r"\b(?:" + "|".join(word_start_alternatives) + ")")
+        self.matcher = re.compile("|".join(alternatives)) if alternatives else None
+
+    def _replace(self, match):
+        replacement, first_group = self.replacements[match.lastindex]
+        if isinstance(replacement, str):
+            return replacement
+        return replacement(RuleMatch(match, first_group))
+
+    def apply(self, text):
+        if self.matcher is None:
+            return text
+        return self.matcher.sub(self._replace, text)
+
+
+def make_title_rule(titles):
+    # All the titles go into one rule: a regex alternation of literals is much faster than one rule per title.
+    #
+    # Titles used to be substituted one at a time, in the order they're listed, so a title could be hidden by an
+    # earlier one: once 'סגן' has been replaced, 'סגן אלוף' can no longer match. Such titles are dropped here.
+    # Of the titles which are left, when two can match at the same place the longer one is always the earlier, so
+    # trying them longest first gives the same result. A title which overlaps the start of an earlier one
+    # ('תת אלוף' vs 'אלוף משנה') must not match when that one would have, so it gets a negative lookahead.
+    # This assumes no title itself starts with ו or ה, as those are taken to be prefixes.
+    alternatives = []
+    replacers = {}
+    earlier_titles = []
+    word_boundary = re.compile(r"\b")
+    for title, translation in titles.items():
+        hidden = False
+        lookaheads = []
+        for earlier_title, earlier_pattern in earlier_titles:
+            for start in range(len(title)):
+                match = earlier_pattern.match(title, start)
+                # at the very start of the title only count it if the earlier title didn't use one of our letters
+                # as its ו/ה prefix
+                if match and (start > 0 or match.group(1) + match.group(2) == ""):
+                    hidden = True
+                    break
+                if start == 0 or not word_boundary.match(title, start):
+                    continue
+                for prefix in ["", "ה", "ו", "וה"]:
+                    overlapping = prefix + earlier_title
+                    remainder = len(title) - start
+                    if len(overlapping) > remainder and overlapping.startswith(title[start:]):
+                        lookaheads.append(fr'(?!{re.escape(overlapping[remainder:])}\b)')
+            if hidden:
+                break
+        if hidden:
+            continue
+        earlier_titles.append((title, re.compile(fr'\b(ו?)(ה?){title}\b')))
+        alternatives.append((title, title + r"\b" + "".join(lookaheads)))
+        replacers[title] = vav_hey(translation)
+
+    alternatives = [alternative for title, alternative in sorted(alternatives, key=lambda a: len(a[0]), reverse=True)]
+    return fr'\b(ו?)(ה?)({"|".join(alternatives)})', lambda m: replacers[m.group(3)](m)
+
+
+def make_rule(rule, lang):
+    # turns a rule from the glossary into a (pattern, replacement) pair for SwapEngine
+    template = re.split(r"\\(\d)", rule["replacement"])    # literal text and group numbers, alternately
+    prefix_group = rule.get("hebrew_prefix_group")
+    if len(template) == 1 and not prefix_group:
+        return rule["pattern"], rule["replacement"]
+    literals = template[0::2]
+    groups = [(int(group), literal) for group, literal in zip(template[1::2], literals[1:])]
+
+    def replace(match):
+        result = tx_heb_prefix(match.group(prefix_group), lang) + literals[0] if prefix_group else literals[0]
+        for group, literal in groups:
+            result += (match.group(group) or "") + literal
+        return result
+    return rule["pattern"], replace
+
+
+def make_rules(rules, lang):
+    return [make_rule(rule, lang) for rule in rules if not rule.get("disabled")]
+
+
+class GlossarySwaps:
+
+    def __init__(self, glossary) -> None:
+        # Pre-translation is done in two passes. The headers we delete are in the first one with the titles: removing
+        # a header can join up the text around it, and the titles must see the text as it was but the other rules
+        # (second pass) as it is afterwards.
+        pre_rules = glossary["pre_translation_rules"]
+        post_rules = glossary["post_translation_rules"]
+        self.pre_translation_engines = {}
+        for lang in glossary["titles"].keys() | pre_rules.keys() - {"all"}:
+            title_rules = [make_title_rule(glossary["titles"][lang])] if glossary["titles"].get(lang) else []
+            self.pre_translation_engines[lang] = [
+                SwapEngine(title_rules + make_rules(glossary["pre_translation_deletions"], lang)),
+                SwapEngine(make_rules(pre_rules["all"] + pre_rules.get(lang, []), lang))]
+        self.default_pre_translation_engines = [SwapEngine(make_rules(glossary["pre_translation_deletions"], "")),
+                                                SwapEngine(make_rules(pre_rules["all"], ""))]
+        self.post_translation_engines = {lang: SwapEngine(make_rules(rules, lang)) for lang, rules in post_rules.items()}
+
+    def pre_translation_swaps(self, text, target_language_code):
+        for engine in self.pre_translation_engines.get(target_language_code, self.default_pre_translation_engines):
+            text = engine.apply(text)
+        return text
+
+    def post_translation_swaps(self, text, target_language_code):
+        engine = self.post_translation_engines.get(target_language_code, self.post_translation_engines["default"])
+        return engine.apply(text)
+
+
+@for_current_glossary
+def current_glossary_swaps(glossary):
+    return GlossarySwaps(glossary)
+
+
+def pre_translation_swaps(text, target_language_code):
+    return current_glossary_swaps().pre_translation_swaps(text, target_language_code)
+
+
+def post_translation_swaps(text, target_language_code):
+    return current_glossary_swaps().post_translation_swaps(text, target_language_code)